@@ -0,0 +1,226 @@
+#!/usr/bin/python
+'''
+Instruction throughput benchmarks for the CPU core.
+
+Runs each workload for a fixed number of instructions and reports
+instructions per second as JSON, so results can be saved per commit and
+compared:
+
+    python -m benchmarks.bench_cpu --cycles 200000 --output before.json
+    python benchmarks/bench_cpu.py roms/ --engine interpreter --engine jit
+
+The synthetic workloads are small hand assembled loops that each stress
+one part of the core. ROM files or directories given on the command line
+are benchmarked as extra workloads. The instruction count comes from the
+core itself (RunResult.cycles / BlockJit.run), so every workload is timed
+over the same amount of emulated work.
+
+Every workload is also run as a plain emulate_cycle loop, the step
+engine. Each row's vs_step is its instructions per second over the step
+loop's on the same workload, so an engine slower than single stepping
+shows up below 1.
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+if __package__ in (None, ''):
+    #Run as a script, the chip8 modules live one directory up
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chip8_corpus
+import chip8_hw
+import chip8_jit
+
+# DRW heavy: walk the font sprite for 0 across the screen forever.
+DRW_LOOP = bytes([
+    0xA0, 0x00,  # 200: LD I, 0x000
+    0x60, 0x00,  # 202: LD V0, 0x00
+    0x61, 0x00,  # 204: LD V1, 0x00
+    0xD0, 0x15,  # 206: DRW V0, V1, 5
+    0x70, 0x08,  # 208: ADD V0, 0x08
+    0x71, 0x03,  # 20A: ADD V1, 0x03
+    0x12, 0x06,  # 20C: JP 0x206
+])
+
+# ALU heavy: every 8xy* operation in a loop.
+ALU_LOOP = bytes([
+    0x60, 0x01,  # 200: LD V0, 0x01
+    0x61, 0x03,  # 202: LD V1, 0x03
+    0x80, 0x14,  # 204: ADD V0, V1
+    0x81, 0x05,  # 206: SUB V1, V0
+    0x82, 0x01,  # 208: OR V2, V0
+    0x83, 0x12,  # 20A: AND V3, V1
+    0x84, 0x03,  # 20C: XOR V4, V0
+    0x85, 0x16,  # 20E: SHR V5
+    0x86, 0x0E,  # 210: SHL V6
+    0x87, 0x17,  # 212: SUBN V7, V1
+    0x88, 0x10,  # 214: LD V8, V1
+    0x12, 0x04,  # 216: JP 0x204
+])
+
+# Memory heavy: BCD, register store and load through I.
+MEMORY_LOOP = bytes([
+    0xA3, 0x00,  # 200: LD I, 0x300
+    0x60, 0x7B,  # 202: LD V0, 0x7B
+    0xF0, 0x33,  # 204: LD B, V0
+    0xF2, 0x55,  # 206: LD [I], V2
+    0xF2, 0x65,  # 208: LD V2, [I]
+    0x70, 0x01,  # 20A: ADD V0, 0x01
+    0x12, 0x04,  # 20C: JP 0x204
+])
+
+# Call/ret: recurse 12 deep, unwind, repeat.
+CALL_LOOP = bytes([
+    0x60, 0x00,  # 200: LD V0, 0x00
+    0x22, 0x08,  # 202: CALL 0x208
+    0x60, 0x00,  # 204: LD V0, 0x00
+    0x12, 0x02,  # 206: JP 0x202
+    0x70, 0x01,  # 208: ADD V0, 0x01
+    0x30, 0x0C,  # 20A: SE V0, 0x0C
+    0x22, 0x08,  # 20C: CALL 0x208
+    0x00, 0xEE,  # 20E: RET
+])
+
+# Game loop idioms: a 6xkk run, Annn+Dxyn and a counted skip+jump loop,
+# the patterns run/run_frame fuse into super-instructions.
+GAME_LOOP = bytes([
+    0x60, 0x00,  # 200: LD V0, 0x00
+    0x61, 0x05,  # 202: LD V1, 0x05
+    0x62, 0x08,  # 204: LD V2, 0x08
+    0xA0, 0x00,  # 206: LD I, 0x000
+    0xD1, 0x25,  # 208: DRW V1, V2, 5
+    0x70, 0x01,  # 20A: ADD V0, 0x01
+    0x30, 0x0A,  # 20C: SE V0, 0x0A
+    0x12, 0x06,  # 20E: JP 0x206
+    0x12, 0x00,  # 210: JP 0x200
+])
+
+WORKLOADS = {
+    'drw': DRW_LOOP,
+    'alu': ALU_LOOP,
+    'memory': MEMORY_LOOP,
+    'call': CALL_LOOP,
+    'game': GAME_LOOP,
+}
+
+
+def _run_step(cpu, cycles):
+    emulate_cycle = cpu.emulate_cycle
+    for _ in range(cycles):
+        emulate_cycle()
+    return cycles, chip8_hw.STOP_MAX_CYCLES
+
+
+def _run_interpreter(cpu, cycles):
+    result = cpu.run(max_cycles=cycles, until_key_wait=False)
+    return result.cycles, result.stop_reason
+
+
+def _run_jit(cpu, cycles):
+    return chip8_jit.BlockJit(cpu).run(cycles), chip8_hw.STOP_MAX_CYCLES
+
+
+ENGINES = {
+    'step': _run_step,
+    'interpreter': _run_interpreter,
+    'jit': _run_jit,
+}
+
+# Engine every workload runs on too, the others are reported against it
+BASELINE_ENGINE = 'step'
+
+
+def _make_cpu(program):
+    cpu = chip8_hw.ChipEightCpu(seed=0)
+    cpu.load_rom_data(program)
+    return cpu
+
+
+def bench(name, program, cycles, engine='interpreter', repeat=3):
+    '''
+    Time program for cycles instructions on engine, best of repeat runs on
+    a fresh CPU each, and return a result row.
+    '''
+    runner = ENGINES[engine]
+    best = None
+    for _ in range(repeat):
+        cpu = _make_cpu(program)
+        start = time.perf_counter()
+        executed, stop_reason = runner(cpu, cycles)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, executed, stop_reason)
+    elapsed, executed, stop_reason = best
+    return {
+        'workload': name,
+        'engine': engine,
+        'cycles': executed,
+        'stop_reason': stop_reason,
+        'seconds': elapsed,
+        'ips': executed / elapsed if elapsed else None,
+    }
+
+
+def run_benchmarks(cycles, engines=('interpreter',), roms=(), repeat=3, workloads=None):
+    '''
+    Run every workload (all synthetic ones by default, plus roms) on the
+    baseline step loop and every engine and return the result rows.
+    '''
+    programs = [(name, WORKLOADS[name]) for name in (workloads or WORKLOADS)]
+    for rom_path in roms:
+        with open(rom_path, 'rb') as rom:
+            programs.append((os.path.basename(rom_path), rom.read()))
+    results = []
+    for name, program in programs:
+        baseline = bench(name, program, cycles, BASELINE_ENGINE, repeat)
+        baseline['vs_step'] = 1.0
+        results.append(baseline)
+        for engine in engines:
+            if engine == BASELINE_ENGINE:
+                continue
+            row = bench(name, program, cycles, engine, repeat)
+            row['vs_step'] = row['ips'] / baseline['ips'] if baseline['ips'] else None
+            results.append(row)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure CHIP-8 core instructions per second.')
+    parser.add_argument('roms', nargs='*', help='extra ROM files or directories to benchmark')
+    parser.add_argument('--cycles', type=float, default=2e5,
+                        help='instructions per run (default 2e5)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per workload, the fastest is reported (default 3)')
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                        help='engine to benchmark, may be repeated (default interpreter),'
+                             ' the step loop always runs as the baseline')
+    parser.add_argument('--workload', action='append', choices=sorted(WORKLOADS),
+                        help='synthetic workload to run, may be repeated (default all)')
+    parser.add_argument('--output', help='JSON results file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(int(args.cycles), args.engine or ['interpreter'],
+                             chip8_corpus.find_roms(args.roms), args.repeat,
+                             args.workload)
+    report = {
+        'python': platform.python_implementation() + ' ' + platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2)
+            out.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/python
+'''
+Vectorized emulator running N CHIP-8 machines in lockstep.
+
+All machine state lives in NumPy arrays with the machine index as the first
+axis. Each step executes one instruction on every machine: opcodes are
+fetched for all machines at once, grouped by their top nibble and each group
+is applied as masked array updates. The semantics follow ChipEightCpu,
+including leaving the PC untouched on unknown opcodes (they are not printed).
+
+Cxkk uses a per machine xorshift32 generator so every machine's random
+stream is reproducible from its seed.
+'''
+
+import numpy as np
+
+import chip8_hw
+
+# Stack levels per machine
+STACK_DEPTH = 16
+
+
+class BatchChipEightCpu(object):
+    def __init__(self, count, seeds=None, cycles_per_frame=chip8_hw.CYCLES_PER_FRAME):
+        self.count = count
+        self.CHIP8MAXMEM = 4096
+        self.memory = np.zeros((count, self.CHIP8MAXMEM), dtype=np.uint8)
+        self.V = np.zeros((count, 16), dtype=np.uint8)
+        self.I = np.zeros(count, dtype=np.uint16)
+        self.pc = np.full(count, 0x200, dtype=np.uint16)
+        self.stack = np.zeros((count, STACK_DEPTH), dtype=np.uint16)
+        self.sp = np.zeros(count, dtype=np.uint8)
+        self.delay_timer = np.zeros(count, dtype=np.uint8)
+        self.sound_timer = np.zeros(count, dtype=np.uint8)
+        self.beep_count = np.zeros(count, dtype=np.int64)
+        #All machines step in lockstep so they share one 60hz frame counter
+        self.cycles_per_frame = cycles_per_frame
+        self.frame_cycles_left = cycles_per_frame
+        self.key = np.zeros((count, 16), dtype=np.uint8)
+        self.gfx_rows = np.zeros((count, chip8_hw.SCREEN_HEIGHT), dtype=np.uint64)
+        self.update_screen = np.zeros(count, dtype=bool)
+
+        if seeds is None:
+            seeds = np.arange(1, count + 1)
+        # xorshift32 state must never be zero
+        self.rng_state = np.asarray(seeds, dtype=np.uint32).copy()
+        self.rng_state[self.rng_state == 0] = 1
+
+        self._machines = np.arange(count)
+        self.memory[:, : len(chip8_hw.FONTSET)] = np.frombuffer(
+            chip8_hw.FONTSET, dtype=np.uint8)
+
+    def load_rom(self, rom_file_path):
+        '''
+        Load the same ROM into every machine at 0x200.
+        Raises ValueError if it does not fit in memory.
+        '''
+        with open(rom_file_path, "rb") as f:
+            data = f.read()
+        self.load_program(data)
+
+    def load_program(self, data):
+        memory_offset = 0x200
+        if len(data) > self.CHIP8MAXMEM - memory_offset:
+            raise ValueError("ROM size exceeds available memory")
+        self.memory[:, memory_offset : memory_offset + len(data)] = np.frombuffer(
+            bytes(data), dtype=np.uint8)
+
+    def to_cpu(self, machine):
+        '''
+        Copy the state of one machine into a new ChipEightCpu.
+        '''
+        cpu = chip8_hw.ChipEightCpu(cycles_per_frame=self.cycles_per_frame)
+        cpu.frame_cycles_left = self.frame_cycles_left
+        cpu.memory[:] = self.memory[machine].tobytes()
+        cpu.V[:] = [int(v) for v in self.V[machine]]
+        cpu.I = int(self.I[machine])
+        cpu.pc = int(self.pc[machine])
+        cpu.stack = [int(v) for v in self.stack[machine, : self.sp[machine]]]
+        cpu.delay_timer = int(self.delay_timer[machine])
+        cpu.sound_timer = int(self.sound_timer[machine])
+        cpu.beep_count = int(self.beep_count[machine])
+        cpu.key[:] = [int(k) for k in self.key[machine]]
+        cpu.gfx_rows[:] = [int(row) for row in self.gfx_rows[machine]]
+        # Both use the same xorshift32 steps, the CPU carries on the stream
+        cpu.seed_rng(int(self.rng_state[machine]))
+        return cpu
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+
+    def step(self):
+        '''
+        Execute one instruction on every machine.
+        '''
+        machines = self._machines
+        pc = self.pc.astype(np.int64)
+        opcode = (self.memory[machines, pc].astype(np.int64) << 8) | \
+            self.memory[machines, pc + 1]
+        family = opcode >> 12
+
+        for nibble in np.unique(family):
+            idx = machines[family == nibble]
+            op = opcode[idx]
+            self._handlers[nibble](self, idx, op)
+
+        self.frame_cycles_left -= 1
+        if not self.frame_cycles_left:
+            self.frame_cycles_left = self.cycles_per_frame
+            self.timer_tick()
+
+    def timer_tick(self):
+        '''
+        One 60hz tick of every machine's timers.
+        '''
+        self.beep_count += self.sound_timer == 1
+        np.subtract(self.delay_timer, 1, out=self.delay_timer,
+                    where=self.delay_timer > 0)
+        np.subtract(self.sound_timer, 1, out=self.sound_timer,
+                    where=self.sound_timer > 0)
+
+    def _skip(self, idx, condition):
+        self.pc[idx] += np.where(condition, 4, 2).astype(np.uint16)
+
+    def _random_bytes(self, idx):
+        state = self.rng_state[idx]
+        state ^= state << np.uint32(13)
+        state ^= state >> np.uint32(17)
+        state ^= state << np.uint32(5)
+        self.rng_state[idx] = state
+        return (state & 0xFF).astype(np.uint8)
+
+    def _x0(self, idx, op):
+        cls = idx[op == 0x00E0]
+        self.gfx_rows[cls] = 0
+        self.update_screen[cls] = True
+        self.pc[cls] += 2
+        ret = idx[op == 0x00EE]
+        self.sp[ret] -= 1
+        self.pc[ret] = self.stack[ret, self.sp[ret]]
+
+    def _jp_addr(self, idx, op):
+        self.pc[idx] = op & 0x0FFF
+
+    def _call_addr(self, idx, op):
+        self.stack[idx, self.sp[idx]] = self.pc[idx] + 2
+        self.sp[idx] += 1
+        self.pc[idx] = op & 0x0FFF
+
+    def _se_vx_byte(self, idx, op):
+        self._skip(idx, self.V[idx, (op >> 8) & 0xF] == (op & 0xFF))
+
+    def _sne_vx_byte(self, idx, op):
+        self._skip(idx, self.V[idx, (op >> 8) & 0xF] != (op & 0xFF))
+
+    def _se_vx_vy(self, idx, op):
+        self._skip(idx, self.V[idx, (op >> 8) & 0xF] == self.V[idx, (op >> 4) & 0xF])
+
+    def _sne_vx_vy(self, idx, op):
+        self._skip(idx, self.V[idx, (op >> 8) & 0xF] != self.V[idx, (op >> 4) & 0xF])
+
+    def _ld_vx_byte(self, idx, op):
+        self.V[idx, (op >> 8) & 0xF] = op & 0xFF
+        self.pc[idx] += 2
+
+    def _add_vx_byte(self, idx, op):
+        x = (op >> 8) & 0xF
+        self.V[idx, x] = (self.V[idx, x].astype(np.int64) + (op & 0xFF)) & 0xFF
+        self.pc[idx] += 2
+
+    def _x8(self, idx, op):
+        V = self.V
+        for n in np.unique(op & 0xF):
+            sel = (op & 0xF) == n
+            m = idx[sel]
+            x = (op[sel] >> 8) & 0xF
+            y = (op[sel] >> 4) & 0xF
+            #Every update re-reads the registers in the same order as the
+            #ChipEightCpu handlers so VF aliasing gives identical results.
+            if n == 0x0:
+                V[m, x] = V[m, y]
+            elif n == 0x1:
+                V[m, x] = V[m, x] | V[m, y]
+            elif n == 0x2:
+                V[m, x] = V[m, x] & V[m, y]
+            elif n == 0x3:
+                V[m, x] = V[m, x] ^ V[m, y]
+            elif n == 0x4:
+                total = V[m, x].astype(np.int64) + V[m, y]
+                V[m, 0xF] = total > 0xFF
+                V[m, x] = total & 0xFF
+            elif n == 0x5:
+                V[m, 0xF] = V[m, x] >= V[m, y]
+                V[m, x] = (V[m, x].astype(np.int64) - V[m, y]) & 0xFF
+            elif n == 0x6:
+                V[m, 0xF] = V[m, x] & 0x1
+                V[m, x] = V[m, x] >> 1
+            elif n == 0x7:
+                V[m, 0xF] = V[m, y] >= V[m, x]
+                V[m, x] = (V[m, y].astype(np.int64) - V[m, x]) & 0xFF
+            elif n == 0xE:
+                V[m, 0xF] = (V[m, x] >> 7) & 0x1
+                V[m, x] = (V[m, x].astype(np.int64) << 1) & 0xFF
+            else:
+                continue
+            self.pc[m] += 2
+
+    def _ld_I(self, idx, op):
+        self.I[idx] = op & 0x0FFF
+        self.pc[idx] += 2
+
+    def _jp_v0(self, idx, op):
+        self.pc[idx] = (op & 0x0FFF) + self.V[idx, 0]
+
+    def _rnd_vx_byte(self, idx, op):
+        self.V[idx, (op >> 8) & 0xF] = self._random_bytes(idx) & (op & 0xFF)
+        self.pc[idx] += 2
+
+    def _drw_vx_vy(self, idx, op):
+        V = self.V
+        drw_x = (V[idx, (op >> 8) & 0xF] % chip8_hw.SCREEN_WIDTH).astype(np.uint64)
+        drw_y = V[idx, (op >> 4) & 0xF].astype(np.int64)
+        height = op & 0xF
+        I = self.I[idx].astype(np.int64)
+        collision = np.zeros(len(idx), dtype=bool)
+        for sprite_row in range(int(height.max(initial=0))):
+            active = height > sprite_row
+            m = idx[active]
+            sprite = self.memory[m, I[active] + sprite_row].astype(np.uint64) << np.uint64(56)
+            x = drw_x[active]
+            #Shifting a uint64 by 64 is undefined, column 0 needs no wrap part
+            wrapped = np.where(x == 0, np.uint64(0),
+                               sprite << ((np.uint64(64) - x) % np.uint64(64)))
+            sprite = (sprite >> x) | wrapped
+            y = (drw_y[active] + sprite_row) % chip8_hw.SCREEN_HEIGHT
+            row = self.gfx_rows[m, y]
+            collision[active] |= (row & sprite) != 0
+            self.gfx_rows[m, y] = row ^ sprite
+        V[idx, 0xF] = collision
+        self.update_screen[idx] = True
+        self.pc[idx] += 2
+
+    def _xE(self, idx, op):
+        kk = op & 0xFF
+        pressed = self.key[idx, self.V[idx, (op >> 8) & 0xF]] == 1
+        skp = kk == 0x9E
+        self._skip(idx[skp], pressed[skp])
+        sknp = kk == 0xA1
+        self._skip(idx[sknp], ~pressed[sknp])
+
+    def _xF(self, idx, op):
+        V = self.V
+        x = (op >> 8) & 0xF
+        kk = op & 0xFF
+        advance = np.zeros(len(idx), dtype=bool)
+
+        sel = kk == 0x07
+        V[idx[sel], x[sel]] = self.delay_timer[idx[sel]]
+        advance |= sel
+
+        sel = kk == 0x0A
+        if sel.any():
+            m = idx[sel]
+            keys = self.key[m] == 1
+            pressed = keys.any(axis=1)
+            V[m[pressed], x[sel][pressed]] = keys[pressed].argmax(axis=1)
+            advance[np.flatnonzero(sel)[pressed]] = True
+
+        sel = kk == 0x15
+        self.delay_timer[idx[sel]] = V[idx[sel], x[sel]]
+        advance |= sel
+
+        sel = kk == 0x18
+        self.sound_timer[idx[sel]] = V[idx[sel], x[sel]]
+        advance |= sel
+
+        sel = kk == 0x1E
+        self.I[idx[sel]] += V[idx[sel], x[sel]]
+        advance |= sel
+
+        sel = kk == 0x29
+        self.I[idx[sel]] = V[idx[sel], x[sel]].astype(np.uint16) * 5
+        advance |= sel
+
+        sel = kk == 0x33
+        if sel.any():
+            m = idx[sel]
+            I = self.I[m].astype(np.int64)
+            value = V[m, x[sel]]
+            self.memory[m, I] = value // 100
+            self.memory[m, I + 1] = (value % 100) // 10
+            self.memory[m, I + 2] = value % 10
+            advance |= sel
+
+        for kind in (0x55, 0x65):
+            sel = kk == kind
+            if not sel.any():
+                continue
+            m = idx[sel]
+            I = self.I[m].astype(np.int64)
+            for register in range(16):
+                active = x[sel] >= register
+                if not active.any():
+                    break
+                if kind == 0x55:
+                    self.memory[m[active], I[active] + register] = V[m[active], register]
+                else:
+                    V[m[active], register] = self.memory[m[active], I[active] + register]
+            advance |= sel
+
+        self.pc[idx[advance]] += 2
+
+    _handlers = {
+            0x0 : _x0,
+            0x1 : _jp_addr,
+            0x2 : _call_addr,
+            0x3 : _se_vx_byte,
+            0x4 : _sne_vx_byte,
+            0x5 : _se_vx_vy,
+            0x6 : _ld_vx_byte,
+            0x7 : _add_vx_byte,
+            0x8 : _x8,
+            0x9 : _sne_vx_vy,
+            0xA : _ld_I,
+            0xB : _jp_v0,
+            0xC : _rnd_vx_byte,
+            0xD : _drw_vx_vy,
+            0xE : _xE,
+            0xF : _xF
+    }
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+'''
+ROM corpus indexed by content hash.
+
+A RomCorpus reads ROM files and directories of ROMs, or maps packed
+archives made by write_archive, and indexes every ROM by the SHA-1 of
+its contents. ROM files are read once into shared arenas and closed, so
+a corpus holds no file descriptor per ROM, and an archive is one
+mapping. Lookups hand out read-only memoryviews straight into the arena
+or mapping, and ChipEightCpu.load_rom_data copies them into memory once,
+so loading the same ROM again opens no file and makes no further copies:
+
+    corpus = RomCorpus(['roms/'])
+    for digest in corpus:
+        corpus.load(cpu, digest)
+
+Identical ROMs under different names are stored once; corpus.paths lists
+every name seen for a digest.
+'''
+
+import hashlib
+import mmap
+import os
+import struct
+
+ROM_EXTENSIONS = ('.ch8', '.c8')
+
+# Packed archive: header (magic, ROM count), then per ROM an entry header
+# (name length, data length), the UTF-8 name and the data.
+ARCHIVE_MAGIC = b'C8RA'
+ARCHIVE_HEADER = struct.Struct('<4sI')
+ARCHIVE_ENTRY = struct.Struct('<HI')
+
+# ROM files are read into shared arenas of this many bytes, a file larger
+# than an arena gets a buffer of its own
+ARENA_SIZE = 1 << 20
+
+
+def find_roms(paths):
+    '''
+    Expand files and directories into a sorted list of ROM paths.
+    '''
+    roms = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                for filename in filenames:
+                    if filename.lower().endswith(ROM_EXTENSIONS):
+                        roms.append(os.path.join(dirpath, filename))
+        else:
+            roms.append(path)
+    return sorted(roms)
+
+
+def write_archive(archive_path, rom_paths):
+    '''
+    Pack rom_paths into one archive file that RomCorpus.add_archive maps.
+    '''
+    with open(archive_path, 'wb') as out:
+        out.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(rom_paths)))
+        for rom_path in rom_paths:
+            with open(rom_path, 'rb') as rom:
+                data = rom.read()
+            name = os.path.basename(rom_path).encode('utf-8')
+            out.write(ARCHIVE_ENTRY.pack(len(name), len(data)))
+            out.write(name)
+            out.write(data)
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        # The mapping stays valid after the file is closed
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class _Arena(object):
+    '''
+    Fixed size buffers ROM files are read into back to back. Buffers are
+    never resized, the memoryviews handed out keep pointing at them.
+    '''
+    def __init__(self, size=ARENA_SIZE):
+        self.size = size
+        #The first read allocates a buffer
+        self._buffer = memoryview(bytearray())
+        self._used = 0
+
+    def read(self, f, length):
+        '''
+        Read length bytes from f into the arena and return a writable view
+        of what was read. Nothing is kept until commit is called.
+        '''
+        if length > self.size:
+            buffer = memoryview(bytearray(length))
+            return buffer[:f.readinto(buffer)]
+        if self._used + length > len(self._buffer):
+            self._buffer = memoryview(bytearray(self.size))
+            self._used = 0
+        view = self._buffer[self._used : self._used + length]
+        return view[:f.readinto(view)]
+
+    def commit(self, view):
+        '''
+        Keep view, the last read, so the next read lands after it.
+        '''
+        if view.obj is self._buffer.obj:
+            self._used += len(view)
+
+
+class RomCorpus(object):
+    def __init__(self, paths=()):
+        # digest -> read-only memoryview of the ROM data
+        self._roms = {}
+        # digest -> every path (or archive path:name) the ROM was found as
+        self.paths = {}
+        # path -> digest, so adding a file twice doesn't hash it again
+        self._digests = {}
+        self._arena = _Arena()
+        for path in paths:
+            if path.lower().endswith('.c8ra'):
+                self.add_archive(path)
+            else:
+                for rom_path in find_roms([path]):
+                    self.add_file(rom_path)
+
+    def __len__(self):
+        return len(self._roms)
+
+    def __iter__(self):
+        return iter(self._roms)
+
+    def __contains__(self, digest):
+        return digest in self._roms
+
+    def __getitem__(self, digest):
+        '''
+        Read-only memoryview of the ROM with this SHA-1 hex digest.
+        '''
+        return self._roms[digest]
+
+    def _add(self, name, view):
+        digest = hashlib.sha1(view).hexdigest()
+        # Duplicates keep the first copy
+        self._roms.setdefault(digest, view.toreadonly())
+        self.paths.setdefault(digest, []).append(name)
+        self._digests[name] = digest
+        return digest
+
+    def add_file(self, path):
+        '''
+        Read one ROM file into the arena and return its digest. The file
+        is closed again, duplicates of a ROM already added take no space.
+        '''
+        digest = self._digests.get(path)
+        if digest is None:
+            with open(path, 'rb') as f:
+                view = self._arena.read(f, os.fstat(f.fileno()).st_size)
+            count = len(self._roms)
+            digest = self._add(path, view)
+            if len(self._roms) > count:
+                self._arena.commit(view)
+        return digest
+
+    def add_archive(self, path):
+        '''
+        Map an archive made by write_archive and return the digests of the
+        ROMs in it, in archive order.
+        '''
+        view = _map_file(path)
+        magic, count = ARCHIVE_HEADER.unpack_from(view)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("%s is not a ROM archive" % path)
+        digests = []
+        offset = ARCHIVE_HEADER.size
+        for _ in range(count):
+            name_length, data_length = ARCHIVE_ENTRY.unpack_from(view, offset)
+            offset += ARCHIVE_ENTRY.size
+            name = bytes(view[offset : offset + name_length]).decode('utf-8')
+            offset += name_length
+            if offset + data_length > len(view):
+                raise ValueError("%s is truncated" % path)
+            digests.append(self._add('%s:%s' % (path, name),
+                                     view[offset : offset + data_length]))
+            offset += data_length
+        return digests
+
+    def load(self, cpu, digest):
+        '''
+        Reset cpu and load the ROM with this digest into it.
+        '''
+        cpu.load_rom_data(self._roms[digest])
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+'''
+Static disassembler and control flow graph builder for CHIP-8 ROMs.
+
+build_cfg walks a ROM from its entry point, following jumps, calls and
+both outcomes of skips, and splits the reachable instructions into basic
+blocks. Bytes never reached as an instruction are treated as data.
+Mnemonics are the ChipEightCpu handler names (ld_vx_byte, drw_vx_vy, ...),
+found through ChipEightCpu.decode_opcode so the disassembly decodes
+exactly like the CPU does.
+
+    cfg = build_cfg(cpu.rom)
+    print(cfg.listing())
+    predecode(cpu, cfg)
+
+Bnnn (jp_v0) jumps are computed at run time and can't be followed, code
+only reached through one is listed as data.
+'''
+
+import chip8_hw
+
+# Handlers that skip the next instruction when their condition holds
+SKIPS = frozenset([
+    'se_vx_byte', 'sne_vx_byte', 'se_vx_vy', 'sne_vx_vy', 'skp_vx', 'sknp_vx',
+])
+# Handlers that never fall through to the next instruction
+JUMPS = frozenset(['jp_addr', 'jp_v0', 'ret'])
+
+_OPERANDS = {
+    'jp_addr': '{nnn}',
+    'call_addr': '{nnn}',
+    'ld_I': '{nnn}',
+    'jp_v0': 'V0, {nnn}',
+    'se_vx_byte': 'V{x}, {kk}',
+    'sne_vx_byte': 'V{x}, {kk}',
+    'ld_vx_byte': 'V{x}, {kk}',
+    'add_vx_byte': 'V{x}, {kk}',
+    'rnd_vx_byte': 'V{x}, {kk}',
+    'se_vx_vy': 'V{x}, V{y}',
+    'sne_vx_vy': 'V{x}, V{y}',
+    'ld_vx_vy': 'V{x}, V{y}',
+    'or_vx_vy': 'V{x}, V{y}',
+    'and_vx_vy': 'V{x}, V{y}',
+    'xor_vx_vy': 'V{x}, V{y}',
+    'add_vx_vy': 'V{x}, V{y}',
+    'sub_vx_vy': 'V{x}, V{y}',
+    'subn_vx_vy': 'V{x}, V{y}',
+    'drw_vx_vy': 'V{x}, V{y}, {n}',
+}
+for _name in ['shr_vx', 'shl_vx', 'skp_vx', 'sknp_vx', 'ld_vx_dt', 'ld_vx_k',
+              'ld_dt_vx', 'ld_st_vx', 'add_I_vx', 'ld_f_vx', 'ld_b_vx',
+              'ld_i_vx', 'ld_vx_i']:
+    _OPERANDS[_name] = 'V{x}'
+
+
+class Instruction(object):
+    def __init__(self, address, opcode, mnemonic):
+        self.address = address
+        self.opcode = opcode
+        self.mnemonic = mnemonic
+
+    @property
+    def operands(self):
+        opcode = self.opcode
+        return _OPERANDS.get(self.mnemonic, '').format(
+            x='%X' % ((opcode & 0x0F00) >> 8),
+            y='%X' % ((opcode & 0x00F0) >> 4),
+            n=opcode & 0x000F,
+            kk='0x%02X' % (opcode & 0x00FF),
+            nnn='0x%03X' % (opcode & 0x0FFF))
+
+    def targets(self):
+        '''
+        Addresses execution can continue at after this instruction.
+        '''
+        address = self.address
+        if self.mnemonic in SKIPS:
+            return [address + 2, address + 4]
+        if self.mnemonic == 'jp_addr':
+            return [self.opcode & 0x0FFF]
+        if self.mnemonic == 'call_addr':
+            return [self.opcode & 0x0FFF, address + 2]
+        if self.mnemonic in JUMPS:
+            return []
+        return [address + 2]
+
+    def ends_block(self):
+        return self.mnemonic in SKIPS or self.mnemonic in JUMPS or \
+            self.mnemonic == 'call_addr'
+
+    def __str__(self):
+        text = '%03X: %04X  %s' % (self.address, self.opcode, self.mnemonic)
+        operands = self.operands
+        return text + ' ' + operands if operands else text
+
+
+class BasicBlock(object):
+    def __init__(self, start):
+        self.start = start
+        self.instructions = []
+        # Start addresses of the blocks execution can continue in
+        self.successors = []
+
+    @property
+    def end(self):
+        '''
+        Address just past the last instruction.
+        '''
+        return self.instructions[-1].address + 2
+
+
+class ControlFlowGraph(object):
+    def __init__(self, rom, origin):
+        self.rom = rom
+        self.origin = origin
+        # address -> Instruction for every reachable instruction
+        self.instructions = {}
+        # start address -> BasicBlock
+        self.blocks = {}
+
+    def is_code(self, address):
+        '''
+        True if the byte at address is part of a reachable instruction.
+        '''
+        return address in self.instructions or address - 1 in self.instructions
+
+    def data_ranges(self):
+        '''
+        (start, end) address ranges of the ROM bytes that aren't code.
+        '''
+        ranges = []
+        start = None
+        end = self.origin + len(self.rom)
+        for address in range(self.origin, end):
+            if self.is_code(address):
+                if start is not None:
+                    ranges.append((start, address))
+                    start = None
+            elif start is None:
+                start = address
+        if start is not None:
+            ranges.append((start, end))
+        return ranges
+
+    def listing(self):
+        '''
+        Disassembly of the ROM: each basic block with its successors, and
+        the data ranges as hex bytes, in address order.
+        '''
+        parts = []
+        for start, block in self.blocks.items():
+            lines = ['block_%03X:' % start]
+            lines.extend('    %s' % instruction for instruction in block.instructions)
+            if block.successors:
+                lines.append('    -> ' + ', '.join('block_%03X' % s for s in block.successors))
+            parts.append((start, lines))
+        for start, end in self.data_ranges():
+            lines = []
+            for address in range(start, end, 8):
+                chunk = self.rom[address - self.origin : min(address + 8, end) - self.origin]
+                lines.append('%03X: db %s' % (address, bytes(chunk).hex(' ').upper()))
+            parts.append((start, lines))
+        parts.sort(key=lambda part: part[0])
+        return '\n'.join(line for start, lines in parts for line in lines)
+
+
+def build_cfg(rom, origin=0x200, entry=None):
+    '''
+    Walk rom (loaded at origin) from entry, which defaults to origin, and
+    return its ControlFlowGraph.
+    '''
+    cfg = ControlFlowGraph(rom, origin)
+    end = origin + len(rom)
+    entry = origin if entry is None else entry
+    leaders = set([entry])
+    pending = [entry]
+
+    #Find every reachable instruction and the addresses blocks start at.
+    while pending:
+        address = pending.pop()
+        while origin <= address and address + 1 < end and address not in cfg.instructions:
+            offset = address - origin
+            opcode = rom[offset] << 8 | rom[offset + 1]
+            handler = chip8_hw.ChipEightCpu.decode_opcode(opcode)[0]
+            if handler is chip8_hw.ChipEightCpu.invalid_opcode or \
+                    handler in chip8_hw.ChipEightCpu._sub_dispatch_masks:
+                break
+            instruction = Instruction(address, opcode, handler.__name__)
+            cfg.instructions[address] = instruction
+            if instruction.ends_block():
+                for target in instruction.targets():
+                    leaders.add(target)
+                    pending.append(target)
+                break
+            address += 2
+
+    #Cut the instructions into blocks at the leaders.
+    for start in sorted(leaders):
+        if start not in cfg.instructions:
+            continue
+        block = BasicBlock(start)
+        address = start
+        while True:
+            instruction = cfg.instructions[address]
+            block.instructions.append(instruction)
+            address += 2
+            if instruction.ends_block():
+                successors = instruction.targets()
+                break
+            if address in leaders or address not in cfg.instructions:
+                successors = [address]
+                break
+        block.successors = [s for s in successors if s in cfg.instructions]
+        cfg.blocks[start] = block
+    return cfg
+
+
+def predecode(cpu, cfg=None):
+    '''
+    Fill cpu's decoded instruction cache for every instruction found in
+    its ROM (or in cfg) before it runs. Returns the cfg used.
+    '''
+    if cfg is None:
+        cfg = build_cfg(cpu.rom)
+    cpu.predecode(sorted(cfg.instructions))
+    return cfg
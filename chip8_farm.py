@@ -0,0 +1,147 @@
+#!/usr/bin/python
+'''
+Headless ROM farm runner.
+
+Runs every ROM found in the given files/directories on a pool of worker
+processes and writes one report with a row per ROM:
+
+    python -m chip8_farm roms/ --cycles 1e6 --workers 8 --output report.json
+
+Workers only use ChipEightCpu, so no SDL or Tk is needed. Each ROM is run
+with a fixed seed so repeated runs give identical results.
+
+With --movies, a ROM that has an input movie (see chip8_movie) recorded
+for it replays the movie's input instead, which turns recorded QA
+sessions into regression runs:
+
+    python -m chip8_farm roms/ --movies sessions/ --output report.json
+'''
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import hashlib
+import json
+import sys
+import time
+
+import chip8_corpus
+import chip8_hw
+import chip8_movie
+
+find_roms = chip8_corpus.find_roms
+
+REPORT_FIELDS = [
+    'rom',
+    'cycles',
+    'stop_reason',
+    'frames',
+    'beep_count',
+    'framebuffer_hash',
+    'wall_time',
+    'movie',
+    'error',
+]
+
+
+# ROMs mapped by this process, a worker maps each ROM once however many
+# times it runs it.
+_corpus = None
+
+
+def _rom_corpus():
+    global _corpus
+    if _corpus is None:
+        _corpus = chip8_corpus.RomCorpus()
+    return _corpus
+
+
+def run_rom(rom_path, cycles, seed=0, movies=None):
+    '''
+    Run one ROM headless for up to cycles instructions and return its
+    report row. If movies (ROM digest -> movie path) has a movie for the
+    ROM, its input is replayed with the movie's seed. Errors are reported
+    in the row instead of raised so one bad ROM does not stop the farm.
+    '''
+    row = dict.fromkeys(REPORT_FIELDS)
+    row['rom'] = rom_path
+    start = time.perf_counter()
+    try:
+        cpu = chip8_hw.ChipEightCpu(seed=seed)
+        corpus = _rom_corpus()
+        digest = corpus.add_file(rom_path)
+        corpus.load(cpu, digest)
+        movie_path = movies.get(digest) if movies else None
+        # Unknown opcodes are printed by ChipEightCpu, keep them out of a
+        # report written to stdout.
+        with contextlib.redirect_stdout(sys.stderr):
+            if movie_path is None:
+                result = cpu.run(max_cycles=cycles)
+            else:
+                row['movie'] = movie_path
+                movie = chip8_movie.Movie(movie_path)
+                try:
+                    result = movie.play(cpu, max_cycles=cycles)
+                finally:
+                    movie.close()
+        row['cycles'] = result.cycles
+        row['stop_reason'] = result.stop_reason
+        row['frames'] = result.frames
+        row['beep_count'] = cpu.beep_count
+        row['framebuffer_hash'] = hashlib.sha1(cpu.framebuffer_bytes()).hexdigest()
+    except Exception as e:
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+    row['wall_time'] = time.perf_counter() - start
+    return row
+
+
+def run_farm(roms, cycles, workers=None, seed=0, movies=None):
+    '''
+    Run every ROM and return the report rows in the same order as roms.
+    workers=1 runs in this process.
+    '''
+    jobs = [(rom, cycles, seed, movies) for rom in roms]
+    if workers == 1:
+        return [run_rom(*job) for job in jobs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_rom, *zip(*jobs))) if jobs else []
+
+
+def write_report(rows, out, report_format='json'):
+    if report_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(rows, out, indent=2)
+        out.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run CHIP-8 ROMs headless on a process pool.')
+    parser.add_argument('paths', nargs='+', help='ROM files or directories of ROMs')
+    parser.add_argument('--cycles', type=float, default=1e6,
+                        help='instruction budget per ROM (default 1e6)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=0, help='RNG seed for Cxkk')
+    parser.add_argument('--movies', action='append', default=[],
+                        help='input movie file or directory to replay, may be repeated')
+    parser.add_argument('--format', dest='report_format', choices=('json', 'csv'),
+                        default='json')
+    parser.add_argument('--output', help='report file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    rows = run_farm(find_roms(args.paths), int(args.cycles), args.workers, args.seed,
+                    chip8_movie.find_movies(args.movies))
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            write_report(rows, out, args.report_format)
+    else:
+        write_report(rows, sys.stdout, args.report_format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,278 @@
 #!/usr/bin/python
 
+import collections
+import functools
 import random
+import struct
+
+SCREEN_WIDTH = 64
+SCREEN_HEIGHT = 32
+# A full 64 pixel display row
+ROW_MASK = (1 << SCREEN_WIDTH) - 1
+BLANK_ROWS = [0] * SCREEN_HEIGHT
+# dirty_rows value with every display row marked
+ALL_ROWS_DIRTY = (1 << SCREEN_HEIGHT) - 1
+
+# Built in 4x5 pixel font for the hex digits 0-F
+FONTSET = bytes([
+    0xF0, 0x90, 0x90, 0x90, 0xF0,  # 0
+    0x20, 0x60, 0x20, 0x20, 0x70,  # 1
+    0xF0, 0x10, 0xF0, 0x80, 0xF0,  # 2
+    0xF0, 0x10, 0xF0, 0x10, 0xF0,  # 3
+    0x90, 0x90, 0xF0, 0x10, 0x10,  # 4
+    0xF0, 0x80, 0xF0, 0x10, 0xF0,  # 5
+    0xF0, 0x80, 0xF0, 0x90, 0xF0,  # 6
+    0xF0, 0x10, 0x20, 0x40, 0x40,  # 7
+    0xF0, 0x90, 0xF0, 0x90, 0xF0,  # 8
+    0xF0, 0x90, 0xF0, 0x10, 0xF0,  # 9
+    0xF0, 0x90, 0xF0, 0x90, 0x90,  # A
+    0xE0, 0x90, 0xE0, 0x90, 0xE0,  # B
+    0xF0, 0x80, 0x80, 0x80, 0xF0,  # C
+    0xE0, 0x90, 0x90, 0x90, 0xE0,  # D
+    0xF0, 0x80, 0xF0, 0x80, 0xF0,  # E
+    0xF0, 0x80, 0xF0, 0x80, 0x80   # F
+])
+
+# Memory right after reset: zeroed with the fontset at 0x000
+POWER_ON_MEMORY = FONTSET + bytes(4096 - len(FONTSET))
+# V0-VF and the keypad after reset
+ZERO_REGISTERS = bytes(16)
+
+
+# Instructions executed per 60 Hz timer tick (about 700 Hz)
+CYCLES_PER_FRAME = 12
+
+# Reasons ChipEightCpu.run returned
+STOP_MAX_CYCLES = 'max_cycles'
+STOP_PC = 'pc'
+STOP_FRAME = 'frame'
+STOP_KEY_WAIT = 'key_wait'
+STOP_INVALID_OPCODE = 'invalid_opcode'
+
+# Result of ChipEightCpu.run: instructions executed, one of the STOP_*
+# reasons and how many frames (CLS/DRW display updates) were drawn.
+RunResult = collections.namedtuple('RunResult', 'cycles stop_reason frames')
+
+
+# Fixed layout used by ChipEightCpu.snapshot/restore: magic, version,
+# memory, V, I, pc, stack depth, 16 stack slots, delay timer, sound timer,
+# keys, display rows, beep_count, draw_count, frame_cycles_left, rng_state
+# and rng_pos.
+SNAPSHOT_MAGIC = b'C8SS'
+SNAPSHOT_VERSION = 3
+STACK_DEPTH = 16
+SNAPSHOT_FORMAT = struct.Struct('<4sB4096s16sIHB%dHBB16s%dQQQIIB'
+                                % (STACK_DEPTH, SCREEN_HEIGHT))
+# restore compares memory in blocks of this many bytes and invalidates the
+# changed span of each block that differs
+RESTORE_BLOCK = 256
+
+# Random bytes for Cxkk are generated this many at a time
+RNG_BLOCK = 256
+
+
+def xorshift_bytes(state, count):
+    '''
+    Step the xorshift32 generator count times from state. Returns the new
+    state and the low byte of every step, the same stream
+    BatchChipEightCpu produces for a machine.
+    '''
+    out = bytearray(count)
+    for i in range(count):
+        state ^= (state << 13) & 0xFFFFFFFF
+        state ^= state >> 17
+        state ^= (state << 5) & 0xFFFFFFFF
+        out[i] = state & 0xFF
+    return state, bytes(out)
+
+
+def _call_bound(handler):
+    '''
+    Wrap a handler that isn't one of the CPU's own methods (e.g. a test
+    double put into instruction_dispatch) so it can be cached unbound.
+    '''
+    return lambda cpu, opcode: handler(opcode)
+
+
+# run and run_frame classify every loop head, an address reached by a
+# branch back, the first time they reach it (see ChipEightCpu._loop_head):
+# PLAIN_HEAD, or (idle, fused) with the idle loop and the super-instruction
+# starting there.
+PLAIN_HEAD = ()
+# Super-instructions: (run, instructions) where a skip+1nnn, 6xkk run or
+# Annn+Dxyn starts, else NOT_FUSED. run(cpu) executes the whole pattern and
+# returns how many instructions it executed, at most instructions, so it
+# is only called while that many fit in the frame and the cycle budget.
+NOT_FUSED = ()
+# _idle_loop result for an address that isn't an idle loop head
+NOT_IDLE = ()
+# Longest 6xkk run fused, and so the most bytes a fused entry covers
+FUSED_LOADS_MAX = 4
+FUSED_SPAN_MAX = 2 * FUSED_LOADS_MAX
+
+# Skip handler name -> factory for its condition on the given operands
+_SKIP_TESTS = {
+    'se_vx_byte': lambda x, y, kk: lambda cpu: cpu.V[x] == kk,
+    'sne_vx_byte': lambda x, y, kk: lambda cpu: cpu.V[x] != kk,
+    'se_vx_vy': lambda x, y, kk: lambda cpu: cpu.V[x] == cpu.V[y],
+    'sne_vx_vy': lambda x, y, kk: lambda cpu: cpu.V[x] != cpu.V[y],
+    'skp_vx': lambda x, y, kk: lambda cpu: cpu.key[cpu.V[x]] == 1,
+    'sknp_vx': lambda x, y, kk: lambda cpu: cpu.key[cpu.V[x]] != 1,
+}
+
+
+def _fuse_skip_jump(test, skip_pc, target):
+    '''
+    Skip followed by 1nnn: a conditional branch to target that falls
+    through to skip_pc when the skip is taken.
+    '''
+    def skip_jump(cpu):
+        if test(cpu):
+            cpu.pc = skip_pc
+            return 1
+        cpu.pc = target
+        return 2
+    return skip_jump
+
+
+def _fuse_loads(loads, end):
+    '''
+    A run of 6xkk: store every (x, kk) in loads in order.
+    '''
+    count = len(loads)
+    def load_run(cpu):
+        V = cpu.V
+        for x, kk in loads:
+            V[x] = kk
+        cpu.pc = end
+        return count
+    return load_run
+
+
+def _fuse_load_i_draw(nnn, draw_pc, draw):
+    '''
+    Annn followed by Dxyn: point I at a sprite and draw it.
+    '''
+    drw, draw_opcode, x, y = draw
+    def load_i_draw(cpu):
+        cpu.I = nnn
+        cpu.pc = draw_pc
+        cpu.v_x = x
+        cpu.v_y = y
+        drw(cpu, draw_opcode)
+        return 2
+    return load_i_draw
+
+
+class FrameBufferView(object):
+    '''
+    Flat, list like view of a packed framebuffer with one 0/1 entry per
+    pixel, indexed x + y * 64. Reads and writes go straight to the rows of
+    cpu, writes mark the row dirty like DRW does.
+    '''
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.rows = cpu.gfx_rows
+
+    def __len__(self):
+        return SCREEN_WIDTH * SCREEN_HEIGHT
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        y, x = divmod(index, SCREEN_WIDTH)
+        return (self.rows[y] >> (SCREEN_WIDTH - 1 - x)) & 0x1
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            indexes = range(*index.indices(len(self)))
+            values = list(value)
+            if len(values) != len(indexes):
+                raise ValueError("can't assign %d pixels to a slice of %d"
+                                 % (len(values), len(indexes)))
+            dirty = 0
+            for i, pixel in zip(indexes, values):
+                dirty |= self._set_pixel(i, pixel)
+        else:
+            if index < 0:
+                index += len(self)
+            dirty = self._set_pixel(index, value)
+        if dirty:
+            self.cpu.dirty_rows |= dirty
+            self.cpu.frame_generation += 1
+
+    def _set_pixel(self, index, value):
+        #Returns the dirty bit of the row if the pixel changed, else 0
+        y, x = divmod(index, SCREEN_WIDTH)
+        bit = 1 << (SCREEN_WIDTH - 1 - x)
+        row = self.rows[y]
+        new_row = row | bit if value else row & ~bit
+        if new_row == row:
+            return 0
+        self.rows[y] = new_row
+        return 1 << y
+
+    def __iter__(self):
+        for row in self.rows:
+            for shift in range(SCREEN_WIDTH - 1, -1, -1):
+                yield (row >> shift) & 0x1
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+
+class DispatchTable(dict):
+    '''
+    A machine's instruction_dispatch. Setting or deleting a key moves the
+    machine from the class wide opcode table to one of its own, resolved
+    through this table, so the next decode sees the edit.
+    '''
+    def __init__(self, cpu, handlers):
+        dict.__init__(self, handlers)
+        self.cpu = cpu
+
+    def __setitem__(self, key, handler):
+        dict.__setitem__(self, key, handler)
+        self.cpu._dispatch_edited()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.cpu._dispatch_edited()
+
 
 class ChipEightCpu(object):
-    def __init__(self, debug_callback=None):
+    #Fixed machine state lives in slots, __dict__ is kept for the lazily
+    #built instruction_dispatch and for tests that patch handlers on an
+    #instance.
+    __slots__ = (
+        'CHIP8MAXMEM', 'memory', 'V', 'I', 'pc', 'v_x', 'v_y', 'gfx_rows',
+        'dirty_rows', 'frame_generation', 'update_screen', 'delay_timer',
+        'sound_timer', 'cycles_per_frame', 'frame_cycles_left',
+        'beep_count', 'draw_count', 'stack', 'key', 'debug',
+        'debug_callback', 'rom', 'rng_state', 'rng_pos', '_rng_block',
+        '_rng_next', '_decoded', '_heads', '_heads_end', 'write_hooks',
+        'profiler', '_memory_shared', '_caches_shared', '_opcodes', '__dict__',
+    )
+    # Every slot fork() copies, extended by subclasses with slots of their own
+    _fork_slots = tuple(name for name in __slots__ if name != '__dict__')
+
+    # Decode entry per 16-bit opcode, shared by every machine of the class,
+    # see decode_opcode
+    _opcode_table = [None] * 0x10000
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        #A subclass may override handlers, so it resolves into its own table
+        cls._opcode_table = [None] * 0x10000
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        cls._fork_slots += tuple(name for name in slots if name != '__dict__')
+
+    def __init__(self, debug_callback=None, cycles_per_frame=CYCLES_PER_FRAME,
+                 seed=None):
         #chip8 has 4k of system ram
         '''Systems memory map:
         0x000-0x1FF - Chip 8 interpreter (contains font set in emu)
@@ -16,16 +285,30 @@ class ChipEightCpu(object):
         #Chip8 has 15, 8-bit registers and a 16th register used as a 
         #'carry flag.'
         #The 15 registers are named V0-VE
-        self.V = [0] * 16
+        #Kept in a fixed bytearray that reset clears in place, values
+        #must still be masked to 8 bits before storing.
+        self.V = bytearray(ZERO_REGISTERS)
 
         #Chip8 has an index register and a program counter.
         #The PC can have a value from 0x000 to 0xFFF.
         self.I = 0
         #Start program counter at 0x200
         self.pc = 0x200
-
-        #The graphics are single color with a screen rez of 64 * 32
-        self.gfx = [0] * (64*32)
+        #x and y operands of the instruction being executed, set by the
+        #decoder before every handler call
+        self.v_x = 0
+        self.v_y = 0
+
+        #The graphics are single color with a screen rez of 64 * 32.
+        #Each row is packed into one 64 bit int, the leftmost pixel is the
+        #most significant bit. See the gfx property for a per pixel view.
+        self.gfx_rows = [0] * SCREEN_HEIGHT
+        #Bit y is set when row y changed since the frontend last uploaded
+        #the display, so only those rows need converting.
+        self.dirty_rows = ALL_ROWS_DIRTY
+        #Bumped every time the display contents change. A frontend only
+        #needs to present when this differs from what it last showed.
+        self.frame_generation = 0
         #Used to determine when to update the screen
         self.update_screen = False
         #The chip8 has no Interrupts, but there are two timer registers
@@ -33,17 +316,23 @@ class ChipEightCpu(object):
         #zero
         self.delay_timer = 0
         self.sound_timer = 0
+        #Timers tick once every cycles_per_frame instructions, i.e. at 60hz
+        #of emulated time whatever speed the emulator actually runs at.
+        self.cycles_per_frame = cycles_per_frame
+        self.frame_cycles_left = cycles_per_frame
 
         # Track how many times the sound timer reached 1
         self.beep_count = 0
-        
+        # Count of CLS/DRW instructions, i.e. frames drawn
+        self.draw_count = 0
+
         #The stack has 16 levels
         #I am unsure if I need stack pointer?
         self.stack = []
         #self.stack_pointer = 0
 
-        #The chip8 system has 16 keys (0x0 - 0xF)
-        self.key = [0] * 16
+        #The chip8 system has 16 keys (0x0 - 0xF), 1 while held down
+        self.key = bytearray(ZERO_REGISTERS)
 
         # debug support
         self.debug = False
@@ -52,91 +341,295 @@ class ChipEightCpu(object):
         # store loaded ROM bytes for debug display
         self.rom = bytearray()
 
+        #Cxkk draws from a per machine xorshift32 stream. rng_state is the
+        #generator state at the start of the current block of RNG_BLOCK
+        #bytes and rng_pos the bytes used from it, which together are all
+        #a snapshot needs. Without a seed one is taken from random.
+        self.seed_rng(random.getrandbits(32) if seed is None else seed)
+
+        # Decoded instruction cache, one slot per memory address. Each entry
+        # is a (handler, opcode, x, y) tuple built by _decode the first time
+        # an address is executed.
+        self._decoded = [None] * self.CHIP8MAXMEM
+        # Classification of the loop heads seen so far, keyed by address,
+        # see _loop_head
+        self._heads = {}
+        # Above every address in _heads, invalidate_decoded only looks for
+        # heads to drop when a write starts below it
+        self._heads_end = 0
+        # Callables notified with (start, end) whenever memory is written,
+        # used by higher execution tiers (see chip8_jit) that cache code.
+        self.write_hooks = []
+        #Optional chip8_profile.Profiler, see set_profiler
+        self.profiler = None
+        # True while memory is shared with a machine created by fork(), see
+        # own_memory.
+        self._memory_shared = False
+        # True while the decode caches are shared with a machine created by
+        # fork(), see _own_caches.
+        self._caches_shared = False
+        # Opcode table _decode looks opcodes up in, this machine's own once
+        # its instruction_dispatch is edited
+        self._opcodes = type(self)._opcode_table
+
         self._load_fontset()
 
-        self.instruction_dispatch = {
-                0x0000 : self.x0_dispatch,
-                0x00E0 : self.cls,
-                0x00EE : self.ret,
-                0x1000 : self.jp_addr,
-                0x2000 : self.call_addr,
-                0x3000 : self.se_vx_byte,
-                0x4000 : self.sne_vx_byte,
-                0x5000 : self.se_vx_vy,
-                0x6000 : self.ld_vx_byte,
-                0x7000 : self.add_vx_byte,
-                0x8000 : self.x8_dispatch,
-                # 0x8XY0 handled in x8_dispatch
-                0x8001 : self.or_vx_vy,
-                0x8002 : self.and_vx_vy,
-                0x8003 : self.xor_vx_vy,
-                0x8004 : self.add_vx_vy,
-                0x8005 : self.sub_vx_vy,
-                0x8006 : self.shr_vx,
-                0x8007 : self.subn_vx_vy,
-                0x800E : self.shl_vx,
-                0x9000 : self.sne_vx_vy,
-                0xA000 : self.ld_I,
-                0xB000 : self.jp_v0,
-                0xC000 : self.rnd_vx_byte,
-                0xD000 : self.drw_vx_vy,
-                0xE000 : self.xE_dispatch,
-                0xE00E : self.skp_vx,
-                0xE001 : self.sknp_vx,
-                0xF000 : self.xF_dispatch,
-                0xF007 : self.ld_vx_dt,
-                0xF00A : self.ld_vx_k,
-                0xF015 : self.ld_dt_vx,
-                0xF018 : self.ld_st_vx,
-                0xF01E : self.add_I_vx,
-                0xF029 : self.ld_f_vx,
-                0xF033 : self.ld_b_vx,
-                0xF055 : self.ld_i_vx,
-                0xF065 : self.ld_vx_i
-        }
+    # instruction_dispatch key -> name of the method that runs it
+    _dispatch_names = {
+            0x0000 : 'x0_dispatch',
+            0x00E0 : 'cls',
+            0x00EE : 'ret',
+            0x1000 : 'jp_addr',
+            0x2000 : 'call_addr',
+            0x3000 : 'se_vx_byte',
+            0x4000 : 'sne_vx_byte',
+            0x5000 : 'se_vx_vy',
+            0x6000 : 'ld_vx_byte',
+            0x7000 : 'add_vx_byte',
+            0x8000 : 'x8_dispatch',
+            # 0x8XY0 handled in x8_dispatch
+            0x8001 : 'or_vx_vy',
+            0x8002 : 'and_vx_vy',
+            0x8003 : 'xor_vx_vy',
+            0x8004 : 'add_vx_vy',
+            0x8005 : 'sub_vx_vy',
+            0x8006 : 'shr_vx',
+            0x8007 : 'subn_vx_vy',
+            0x800E : 'shl_vx',
+            0x9000 : 'sne_vx_vy',
+            0xA000 : 'ld_I',
+            0xB000 : 'jp_v0',
+            0xC000 : 'rnd_vx_byte',
+            0xD000 : 'drw_vx_vy',
+            0xE000 : 'xE_dispatch',
+            0xE00E : 'skp_vx',
+            0xE001 : 'sknp_vx',
+            0xF000 : 'xF_dispatch',
+            0xF007 : 'ld_vx_dt',
+            0xF00A : 'ld_vx_k',
+            0xF015 : 'ld_dt_vx',
+            0xF018 : 'ld_st_vx',
+            0xF01E : 'add_I_vx',
+            0xF029 : 'ld_f_vx',
+            0xF033 : 'ld_b_vx',
+            0xF055 : 'ld_i_vx',
+            0xF065 : 'ld_vx_i'
+    }
+
+    @functools.cached_property
+    def instruction_dispatch(self):
+        '''
+        Opcode to handler table, built on first use. Decoding resolves from
+        the class until the table is edited, from then on this machine
+        decodes through it (see DispatchTable).
+        '''
+        return DispatchTable(self, {key: getattr(self, name)
+                                    for key, name in self._dispatch_names.items()})
+
+    @property
+    def gfx(self):
+        '''
+        The display as a flat 64 * 32 sequence of 0/1 pixels.
+        '''
+        return FrameBufferView(self)
+
+    @gfx.setter
+    def gfx(self, pixels):
+        for y in range(SCREEN_HEIGHT):
+            row = 0
+            for pixel in pixels[y * SCREEN_WIDTH : (y + 1) * SCREEN_WIDTH]:
+                row = (row << 1) | (1 if pixel else 0)
+            self.gfx_rows[y] = row
+        self.dirty_rows = ALL_ROWS_DIRTY
+        self.frame_generation += 1
+
+    def framebuffer_bytes(self):
+        '''
+        The display packed as 256 bytes, 8 per row, leftmost pixel in the
+        most significant bit.
+        '''
+        return b''.join(row.to_bytes(SCREEN_WIDTH // 8, 'big') for row in self.gfx_rows)
+
+    def fork(self):
+        '''
+        Return a copy of this machine for branching searches. The two
+        machines share memory until one of them writes to it, at which
+        point the writer takes a private copy (see own_memory), and the
+        decode caches until one of them decodes an address the other
+        hasn't (see _own_caches). Registers, stack, keys and display are
+        copied.
+        '''
+        child = object.__new__(type(self))
+        for name in self._fork_slots:
+            setattr(child, name, getattr(self, name))
+        child.__dict__.update(self.__dict__)
+        # The dispatch table holds methods bound to this machine, the child
+        # builds its own if it ever needs to decode.
+        child.__dict__.pop('instruction_dispatch', None)
+        child.V = self.V[:]
+        child.stack = self.stack[:]
+        child.key = self.key[:]
+        child.gfx_rows = self.gfx_rows[:]
+        child.write_hooks = []
+        self._memory_shared = child._memory_shared = True
+        self._caches_shared = child._caches_shared = True
+        return child
+
+    def set_profiler(self, profiler):
+        '''
+        Install profiler (None removes it). Cached decodes are dropped so
+        every instruction is decoded again through profiler.wrap, without
+        a profiler nothing extra runs per instruction.
+        '''
+        self.profiler = profiler
+        self._drop_decodes()
+
+    def _drop_decodes(self):
+        #New caches rather than clearing them, they may be shared by fork()
+        self._decoded = [None] * self.CHIP8MAXMEM
+        self._heads = {}
+        self._heads_end = 0
+        self._caches_shared = False
+
+    def _dispatch_edited(self):
+        '''
+        Called by DispatchTable when instruction_dispatch changes. Opcodes
+        resolved before are dropped and resolved again through the edited
+        table, into an opcode table private to this machine.
+        '''
+        self._opcodes = [None] * 0x10000
+        self._drop_decodes()
+
+    def own_memory(self):
+        '''
+        Give this machine a private copy of memory if it is shared with a
+        forked machine. Called before every memory write; code writing to
+        cpu.memory directly must call it too. The decode caches stay
+        shared, invalidate_decoded clears the written span in place.
+        '''
+        if self._memory_shared:
+            self.memory = bytearray(self.memory)
+            self._memory_shared = False
+
+    def _own_caches(self):
+        '''
+        Give this machine private copies of the decode caches if they are
+        shared with a forked machine. Called before storing an entry: an
+        entry decoded from this machine's memory may not hold for the
+        other's. Clearing entries needs no copy, the machines sharing the
+        cache only decode those addresses again.
+        '''
+        self._decoded = self._decoded[:]
+        self._heads = dict(self._heads)
+        self._caches_shared = False
+
+    def seed_rng(self, seed, pos=0):
+        '''
+        Restart the Cxkk random stream from seed, or with pos pick up a
+        saved rng_state and rng_pos where they left off.
+        '''
+        #xorshift never leaves a zero state
+        self.rng_state = (seed & 0xFFFFFFFF) or 1
+        self.rng_pos = pos
+        #The block and the state after it are generated by the next Cxkk
+        self._rng_block = None
+        self._rng_next = None
+
+    def snapshot(self):
+        '''
+        Pack the whole machine state into one fixed size bytes object that
+        can be handed back to restore.
+        '''
+        depth = len(self.stack)
+        if depth > STACK_DEPTH:
+            raise ValueError("Stack deeper than %d levels" % STACK_DEPTH)
+        stack = self.stack + [0] * (STACK_DEPTH - depth)
+        return SNAPSHOT_FORMAT.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+            bytes(self.memory), bytes(self.V), self.I, self.pc,
+            depth, *stack,
+            self.delay_timer, self.sound_timer, bytes(self.key),
+            *self.gfx_rows,
+            self.beep_count, self.draw_count, self.frame_cycles_left,
+            self.rng_state, self.rng_pos)
+
+    def restore(self, data):
+        '''
+        Restore state saved by snapshot. Buffers are updated in place, so
+        the dispatch table and fontset are not rebuilt, and only the memory
+        that differs from the snapshot is invalidated.
+        '''
+        if len(data) != SNAPSHOT_FORMAT.size:
+            raise ValueError("Snapshot has the wrong size")
+        fields = SNAPSHOT_FORMAT.unpack(data)
+        if fields[0] != SNAPSHOT_MAGIC or fields[1] != SNAPSHOT_VERSION:
+            raise ValueError("Not a CHIP-8 snapshot or unsupported version")
+        (memory, V, self.I, self.pc, depth) = fields[2:7]
+        stack_end = 7 + STACK_DEPTH
+        self.delay_timer, self.sound_timer, key = fields[stack_end : stack_end + 3]
+        rows_end = stack_end + 3 + SCREEN_HEIGHT
+        (self.beep_count, self.draw_count, self.frame_cycles_left,
+         rng_state, rng_pos) = fields[rows_end:]
+        self.seed_rng(rng_state, rng_pos)
+
+        if self.memory != memory:
+            changed = []
+            for start in range(0, len(memory), RESTORE_BLOCK):
+                end = start + RESTORE_BLOCK
+                old = self.memory[start:end]
+                new = memory[start:end]
+                if old != new:
+                    diff = int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')
+                    #Big endian, so the highest set bit is in the first
+                    #changed byte and the lowest in the last
+                    changed.append((end - (diff.bit_length() + 7) // 8,
+                                    end - ((diff & -diff).bit_length() - 1) // 8))
+            self.own_memory()
+            self.memory[:] = memory
+            for start, end in changed:
+                self.invalidate_decoded(start, end)
+        self.V[:] = V
+        self.stack[:] = fields[7 : 7 + depth]
+        self.key[:] = key
+        self.gfx_rows[:] = fields[stack_end + 3 : rows_end]
+        self.dirty_rows = ALL_ROWS_DIRTY
+        self.frame_generation += 1
+        self.update_screen = True
 
     def _load_fontset(self):
         """Load the CHIP-8 fontset into memory starting at address 0."""
-        fontset = [
-            0xF0, 0x90, 0x90, 0x90, 0xF0,  # 0
-            0x20, 0x60, 0x20, 0x20, 0x70,  # 1
-            0xF0, 0x10, 0xF0, 0x80, 0xF0,  # 2
-            0xF0, 0x10, 0xF0, 0x10, 0xF0,  # 3
-            0x90, 0x90, 0xF0, 0x10, 0x10,  # 4
-            0xF0, 0x80, 0xF0, 0x10, 0xF0,  # 5
-            0xF0, 0x80, 0xF0, 0x90, 0xF0,  # 6
-            0xF0, 0x10, 0x20, 0x40, 0x40,  # 7
-            0xF0, 0x90, 0xF0, 0x90, 0xF0,  # 8
-            0xF0, 0x90, 0xF0, 0x10, 0xF0,  # 9
-            0xF0, 0x90, 0xF0, 0x90, 0x90,  # A
-            0xE0, 0x90, 0xE0, 0x90, 0xE0,  # B
-            0xF0, 0x80, 0x80, 0x80, 0xF0,  # C
-            0xE0, 0x90, 0x90, 0x90, 0xE0,  # D
-            0xF0, 0x80, 0xF0, 0x80, 0xF0,  # E
-            0xF0, 0x80, 0xF0, 0x80, 0x80   # F
-        ]
-
         start = 0x000
-        for i, byte in enumerate(fontset):
-            self.memory[start + i] = byte
+        self.memory[start : start + len(FONTSET)] = FONTSET
 
     def reset(self):
-        self.memory = bytearray(self.CHIP8MAXMEM)
-        self.V = [0] * 16
+        #One copy of the power on image instead of zeroing and then
+        #writing the fontset. Buffers are cleared in place, except memory
+        #still shared with a forked machine.
+        if self._memory_shared:
+            self.memory = bytearray(POWER_ON_MEMORY)
+        else:
+            self.memory[:] = POWER_ON_MEMORY
+        self.V[:] = ZERO_REGISTERS
         self.I = 0
         self.pc = 0x200
-        self.gfx = [0] * (64*32)
+        self.gfx_rows[:] = BLANK_ROWS
+        self.dirty_rows = ALL_ROWS_DIRTY
+        self.frame_generation += 1
         self.update_screen = False
         self.delay_timer = 0
         self.sound_timer = 0
-        self.stack = []
-        self.key = [0] * 16
+        self.frame_cycles_left = self.cycles_per_frame
+        self.stack[:] = ()
+        self.key[:] = ZERO_REGISTERS
         self.beep_count = 0
-
-        self._load_fontset()
+        self.draw_count = 0
 
         self.debug = False
         self.rom = bytearray()
+        self._drop_decodes()
+        self._memory_shared = False
+        for hook in self.write_hooks:
+            hook(0, self.CHIP8MAXMEM)
 
     def load_rom(self, rom_file_path):
         """Load a CHIP-8 ROM into memory starting at address ``0x200``.
@@ -146,22 +639,31 @@ class ChipEightCpu(object):
         will not fit into available memory a ``ValueError`` is raised.
         """
 
+        with open(rom_file_path, "rb") as f:
+            data = f.read()
+        self.load_rom_data(data)
+
+    def load_rom_data(self, data):
+        """Reset and load ROM ``data`` (any bytes-like object) at ``0x200``.
+
+        ``data`` is copied into memory once and kept as ``rom`` without
+        another copy, so it must not change afterwards; ``chip8_corpus``
+        passes read-only views of mapped files. Raises ``ValueError`` if
+        the ROM will not fit into memory.
+        """
+        memory_offset = 0x200
+        if len(data) > self.CHIP8MAXMEM - memory_offset:
+            raise ValueError("ROM size exceeds available memory")
+
         # Preserve debug mode across ROM loads so the debug window doesn't
         # become desynchronized with the CPU state.
         debug_enabled = self.debug
         self.reset()
         self.debug = debug_enabled
 
-        memory_offset = 0x200
-
-        with open(rom_file_path, "rb") as f:
-            data = f.read()
-
-        if len(data) > len(self.memory) - memory_offset:
-            raise ValueError("ROM size exceeds available memory")
-
         self.memory[memory_offset : memory_offset + len(data)] = data
-        self.rom = bytearray(data)
+        self.invalidate_decoded(memory_offset, memory_offset + len(data))
+        self.rom = data
 
 
     def get_opcode(self):
@@ -173,22 +675,444 @@ class ChipEightCpu(object):
         return opcode
 
     def emulate_cycle(self):
-        opcode = self.get_opcode()
-        old_pc = self.pc
-        #Now that we have the opcode we need one big if statement to handle
-        #all the various opcodes. Maybe this can be cleaned up later since python
-        #has no 'switch' statement.
-
-        #Vx and Vy are used very often here are some shortcuts
-        self.v_x = (opcode & 0x0F00) >> 8
-        self.v_y = (opcode & 0x00F0) >> 4
-    
-        handler = self.instruction_dispatch.get(opcode & 0xF000)
-        if handler:
-            handler(opcode)
+        #Instructions are decoded once per address and cached, so the fetch,
+        #the operand masking and the dispatch dict walk only happen the first
+        #time an address is executed (or after it has been written to).
+        entry = self._decoded[self.pc]
+        if entry is None:
+            entry = self._decode(self.pc)
+        handler, opcode, self.v_x, self.v_y = entry
+        handler(self, opcode)
+        self.frame_cycles_left -= 1
+        if not self.frame_cycles_left:
+            self.end_frame()
+
+        if self.debug and self.debug_callback:
+            self.debug_callback(self)
+
+    def run_frame(self):
+        '''
+        Run the rest of the current 60hz frame and tick the timers once,
+        without per instruction timer checks. Returns the cycles executed.
+        '''
+        cycles = self.frame_cycles_left
+        if self.debug:
+            for _ in range(cycles):
+                self.emulate_cycle()
+            return cycles
+        #The caches are only replaced when a miss stores into caches shared
+        #with a forked machine, see _own_caches, so they are reloaded after
+        #every miss and nowhere else.
+        decoded = self._decoded
+        heads = self._heads
+        left = cycles
+        try:
+            while left:
+                pc = self.pc
+                entry = decoded[pc]
+                if entry is None:
+                    entry = self._decode(pc)
+                    decoded, heads = self._decoded, self._heads
+                handler, opcode, self.v_x, self.v_y = entry
+                handler(self, opcode)
+                left -= 1
+                #Idle loops and super-instructions start at loop heads
+                new_pc = self.pc
+                if new_pc <= pc and left:
+                    head = heads.get(new_pc)
+                    if head is None:
+                        head = self._loop_head(new_pc)
+                        decoded, heads = self._decoded, self._heads
+                    if head:
+                        idle, fused = head
+                        if idle:
+                            left -= self._skip_idle(idle, left)
+                        if fused and fused[1] <= left:
+                            left -= fused[0](self)
+        finally:
+            self.frame_cycles_left = left
+        self.end_frame()
+        return cycles
+
+    def run(self, max_cycles=None, until_pc=None, until_frame=None,
+            until_key_wait=True):
+        '''
+        Run instructions in a tight loop until a stop condition is hit:
+        max_cycles instructions executed, the PC landing on until_pc,
+        until_frame frames drawn, (with until_key_wait) a Fx0A waiting
+        for a key, or an unknown opcode. Returns a RunResult.
+        '''
+        if self.debug or until_pc is not None or until_frame is not None:
+            return self._run_checked(max_cycles, until_pc, until_frame,
+                                     until_key_wait)
+        frames_start = self.draw_count
+        #Hoisted like in run_frame
+        decoded = self._decoded
+        heads = self._heads
+        cycles = 0
+        reason = STOP_MAX_CYCLES
+        while cycles != max_cycles:
+            #One countdown per frame, cut short by max_cycles, stands in for
+            #the frame and budget checks after every instruction
+            count = left = self.frame_cycles_left
+            if max_cycles is not None and max_cycles - cycles < count:
+                count = left = max_cycles - cycles
+            try:
+                while left:
+                    pc = self.pc
+                    entry = decoded[pc]
+                    if entry is None:
+                        entry = self._decode(pc)
+                        decoded, heads = self._decoded, self._heads
+                    handler, opcode, self.v_x, self.v_y = entry
+                    handler(self, opcode)
+                    left -= 1
+                    new_pc = self.pc
+                    if new_pc <= pc:
+                        #Only Fx0A without a key, jumps to self and unknown
+                        #opcodes leave the PC where it was, so the opcode
+                        #checks are off the hot path.
+                        if new_pc == pc:
+                            if until_key_wait and (opcode & 0xF0FF) == 0xF00A:
+                                reason = STOP_KEY_WAIT
+                                break
+                            #A profiler wraps the handler, check the
+                            #instruction itself
+                            if self.profiler is not None:
+                                handler = getattr(handler, '__wrapped__', handler)
+                            if handler in self._stop_handlers:
+                                reason = STOP_INVALID_OPCODE
+                                break
+                        try:
+                            head = heads[new_pc]
+                        except KeyError:
+                            head = self._loop_head(new_pc)
+                            decoded, heads = self._decoded, self._heads
+                        if head:
+                            idle, fused = head
+                            if idle:
+                                left -= self._skip_idle(idle, left)
+                            if fused and fused[1] <= left:
+                                left -= fused[0](self)
+            finally:
+                executed = count - left
+                cycles += executed
+                self.frame_cycles_left -= executed
+            if not self.frame_cycles_left:
+                self.end_frame()
+            if reason != STOP_MAX_CYCLES:
+                break
+        return RunResult(cycles, reason, self.draw_count - frames_start)
+
+    def _run_checked(self, max_cycles, until_pc, until_frame, until_key_wait):
+        '''
+        run for debug mode, until_pc and until_frame, which are checked
+        after every instruction. Nothing is fused: a super-instruction
+        can't stop on until_pc inside it, and debug mode runs every
+        instruction through emulate_cycle.
+        '''
+        debug = self.debug
+        emulate_cycle = self.emulate_cycle
+        frames_start = self.draw_count
+        if until_frame is not None:
+            until_frame += frames_start
+        cycles = 0
+        reason = STOP_MAX_CYCLES
+        while cycles != max_cycles:
+            pc = self.pc
+            if debug:
+                emulate_cycle()
+                cycles += 1
+            else:
+                entry = self._decoded[pc]
+                if entry is None:
+                    entry = self._decode(pc)
+                handler, opcode, self.v_x, self.v_y = entry
+                handler(self, opcode)
+                cycles += 1
+                self.frame_cycles_left -= 1
+                if not self.frame_cycles_left:
+                    self.end_frame()
+
+            new_pc = self.pc
+            if new_pc <= pc:
+                if new_pc == pc and debug:
+                    #emulate_cycle left the instruction in the decode cache
+                    entry = self._decoded[pc]
+                    handler, opcode = entry[:2] if entry is not None else (None, 0)
+                if new_pc == pc and handler is not None:
+                    if until_key_wait and (opcode & 0xF0FF) == 0xF00A:
+                        reason = STOP_KEY_WAIT
+                        break
+                    handler = getattr(handler, '__wrapped__', handler)
+                    if handler in self._stop_handlers:
+                        reason = STOP_INVALID_OPCODE
+                        break
+                #Skipped iterations never leave the loop, so they can't pass
+                #until_pc or draw a frame. Debug mode runs every instruction.
+                idle = NOT_IDLE
+                if not debug and (until_pc is None or
+                                  not new_pc <= until_pc <= new_pc + 4):
+                    head = self._heads.get(new_pc)
+                    if head is None:
+                        head = self._loop_head(new_pc)
+                    if head:
+                        idle = head[0]
+                if idle:
+                    budget = self.frame_cycles_left
+                    if max_cycles is not None and max_cycles - cycles < budget:
+                        budget = max_cycles - cycles
+                    skipped = self._skip_idle(idle, budget)
+                    if skipped:
+                        cycles += skipped
+                        self.frame_cycles_left -= skipped
+                        if not self.frame_cycles_left:
+                            self.end_frame()
+            if new_pc == until_pc:
+                reason = STOP_PC
+                break
+            if until_frame is not None and self.draw_count >= until_frame:
+                reason = STOP_FRAME
+                break
+        return RunResult(cycles, reason, self.draw_count - frames_start)
+
+    def _idle_loop(self, address):
+        '''
+        Work out whether address is the head of an idle loop _skip_idle
+        can fast forward: (ld_vx_k,) for Fx0A, (jp_addr,) for a jump to itself,
+        (ld_vx_dt, x, kk, loops_when_equal) for a delay timer poll (Fx07,
+        SE/SNE Vx kk, JP back to the Fx07), or NOT_IDLE.
+        '''
+        idle = NOT_IDLE
+        decoded = self._decoded
+        if address + 1 < self.CHIP8MAXMEM:
+            entry = decoded[address] or self._decode(address)
+            handler = entry[0]
+            if handler is ChipEightCpu.ld_vx_k:
+                idle = (handler,)
+            elif handler is ChipEightCpu.jp_addr:
+                if (entry[1] & 0x0FFF) == address:
+                    idle = (handler,)
+            elif handler is ChipEightCpu.ld_vx_dt and address + 5 < self.CHIP8MAXMEM:
+                test = decoded[address + 2] or self._decode(address + 2)
+                jump = decoded[address + 4] or self._decode(address + 4)
+                if test[2] == entry[2] and jump[0] is ChipEightCpu.jp_addr and \
+                        (jump[1] & 0x0FFF) == address and \
+                        test[0] in (ChipEightCpu.se_vx_byte, ChipEightCpu.sne_vx_byte):
+                    idle = (handler, entry[2], test[1] & 0x00FF,
+                            test[0] is ChipEightCpu.sne_vx_byte)
+        return idle
+
+    def _skip_idle(self, idle, budget):
+        '''
+        Fast forward the idle loop at the PC, as classified by _idle_loop:
+        Fx0A with no key down, a jump to itself, or a delay timer poll
+        that can't exit before the next timer tick. Up to budget cycles of
+        whole loop iterations are skipped, leaving the machine as running
+        them would. budget must not reach past the current frame, the
+        caller accounts the skipped cycles against the frame.
+        Returns the cycles skipped.
+        '''
+        kind = idle[0]
+        if kind is ChipEightCpu.ld_vx_k:
+            return 0 if 1 in self.key else budget
+        if kind is ChipEightCpu.jp_addr:
+            return budget
+        x, kk, loops_when_equal = idle[1:]
+        #The delay timer only changes on a tick, so until then every
+        #iteration reads the same value and takes the same branch.
+        if (self.delay_timer == kk) != loops_when_equal:
+            return 0
+        skipped = budget - budget % 3
+        if skipped:
+            self.V[x] = self.delay_timer
+        return skipped
+
+    def resolve_opcode(self, opcode):
+        '''
+        Return (handler, dispatch key) for opcode, the bound method that
+        executes it and the instruction_dispatch key it was found under.
+        '''
+        return self._resolve(self, self.instruction_dispatch, opcode)
+
+    @staticmethod
+    def _resolve(owner, dispatch, opcode):
+        '''
+        Return (handler, dispatch key) for opcode from dispatch, which maps
+        instruction_dispatch keys to handlers, either the bound methods of
+        the machine owner or the functions of the class owner.
+        The second level dispatchers (x0/x8/xE/xF) are resolved here so the
+        handler is the instruction itself whenever possible.
+        '''
+        masks = owner._sub_dispatch_masks
+        key = opcode & 0xF000
+        handler = dispatch.get(key)
+        if handler is None:
+            return owner.invalid_opcode, key
+        mask = masks.get(getattr(handler, '__func__', handler))
+        if mask is not None:
+            key = opcode & mask
+            leaf = dispatch.get(key)
+            if (opcode & 0xF00F) == 0x8000:
+                handler = owner.ld_vx_vy
+            elif getattr(leaf, '__func__', leaf) in masks:
+                #0x0000 and 0xF000 mask back onto their own dispatcher,
+                #which would recurse forever.
+                handler = owner.invalid_opcode
+            elif leaf is not None:
+                #Unknown opcodes keep going through the dispatcher,
+                #which reports them.
+                handler = leaf
+        return handler, key
+
+    @classmethod
+    def decode_opcode(cls, opcode):
+        '''
+        Return the (handler, opcode, x, y) entry for opcode from the
+        class wide opcode table. The table has a slot for every 16-bit
+        opcode, each resolved from the class's own handlers the first time
+        any machine of the class decodes it and shared from then on, so a
+        decode is one list index once a machine in the process has seen
+        the opcode.
+        '''
+        entry = cls._opcode_table[opcode]
+        if entry is None:
+            dispatch = {key: getattr(cls, name)
+                        for key, name in cls._dispatch_names.items()}
+            handler = cls._resolve(cls, dispatch, opcode)[0]
+            entry = (handler, opcode, (opcode & 0x0F00) >> 8, (opcode & 0x00F0) >> 4)
+            cls._opcode_table[opcode] = entry
+        return entry
+
+    def _resolve_entry(self, opcode):
+        '''
+        Fill the slot for opcode in the opcode table this machine decodes
+        through and return the entry. A machine with an edited
+        instruction_dispatch resolves through it, handlers that aren't its
+        own methods (e.g. a test double) are wrapped to be called unbound.
+        '''
+        if self._opcodes is type(self)._opcode_table:
+            return self.decode_opcode(opcode)
+        handler = self.resolve_opcode(opcode)[0]
+        if getattr(handler, '__self__', None) is self:
+            handler = handler.__func__
         else:
-            print('Unknown/Invalid opcode ' + "0x%0.4X" % opcode)
-        #Decrement timer.
+            handler = _call_bound(handler)
+        entry = (handler, opcode, (opcode & 0x0F00) >> 8, (opcode & 0x00F0) >> 4)
+        self._opcodes[opcode] = entry
+        return entry
+
+    def _decode(self, address):
+        '''
+        Decode the instruction at address into a (handler, opcode, x, y)
+        entry from the opcode table and store it in the decoded
+        instruction cache. Handlers are stored unbound and called as
+        handler(cpu, opcode) so the cache can be shared between forked
+        machines. A profiler wraps the handler per address.
+        '''
+        opcode = self.memory[address] << 8 | self.memory[address + 1]
+        entry = self._opcodes[opcode] or self._resolve_entry(opcode)
+        if self.profiler is not None:
+            key = self.resolve_opcode(opcode)[1]
+            entry = (self.profiler.wrap(entry[0], key, address),) + entry[1:]
+        if self._caches_shared:
+            self._own_caches()
+        self._decoded[address] = entry
+        return entry
+
+    def _fuse(self, address):
+        '''
+        Work out whether address starts a super-instruction:
+        (run, instructions) if the instructions there form a skip followed
+        by 1nnn, a run of 6xkk or Annn followed by Dxyn, else NOT_FUSED. A
+        profiler counts every instruction, so nothing is fused while one
+        is set. emulate_cycle always executes single instructions.
+        '''
+        fused = NOT_FUSED
+        if self.profiler is None and address + 3 < self.CHIP8MAXMEM:
+            first = self._decoded[address] or self._decode(address)
+            second = self._decoded[address + 2] or self._decode(address + 2)
+            handler, opcode, x, y = first
+            test = _SKIP_TESTS.get(handler.__name__)
+            if test is not None and getattr(ChipEightCpu, handler.__name__) is handler:
+                if second[0] is ChipEightCpu.jp_addr:
+                    fused = (_fuse_skip_jump(test(x, y, opcode & 0x00FF),
+                                             address + 4, second[1] & 0x0FFF), 2)
+            elif handler is ChipEightCpu.ld_vx_byte:
+                loads = [(x, opcode & 0x00FF)]
+                end = address + 2
+                while second[0] is ChipEightCpu.ld_vx_byte:
+                    loads.append((second[2], second[1] & 0x00FF))
+                    end += 2
+                    if len(loads) == FUSED_LOADS_MAX or end + 1 >= self.CHIP8MAXMEM:
+                        break
+                    second = self._decoded[end] or self._decode(end)
+                if len(loads) > 1:
+                    fused = (_fuse_loads(loads, end), len(loads))
+            elif handler is ChipEightCpu.ld_I and second[0] is ChipEightCpu.drw_vx_vy:
+                fused = (_fuse_load_i_draw(opcode & 0x0FFF, address + 2, second), 2)
+        return fused
+
+    def _loop_head(self, address):
+        '''
+        Classify the loop head address for run and run_frame and cache the
+        answer: (idle, fused) from _idle_loop and _fuse, or PLAIN_HEAD when
+        neither an idle loop nor a super-instruction starts there.
+        '''
+        idle = self._idle_loop(address)
+        fused = self._fuse(address)
+        head = (idle, fused) if idle or fused else PLAIN_HEAD
+        if self._caches_shared:
+            self._own_caches()
+        self._heads[address] = head
+        if address >= self._heads_end:
+            self._heads_end = address + 1
+        return head
+
+    def predecode(self, addresses):
+        '''
+        Fill the decoded instruction cache for addresses ahead of running
+        them, for example the code addresses found by chip8_disasm.
+        '''
+        decoded = self._decoded
+        for address in addresses:
+            if decoded[address] is None:
+                self._decode(address)
+
+    def invalidate_decoded(self, start, end):
+        '''
+        Drop cached decodes for every instruction overlapping memory
+        start to end (exclusive). Must be called after writing to memory
+        so self-modifying code is re-decoded.
+        '''
+        for hook in self.write_hooks:
+            hook(start, end)
+        fused_start = max(start - FUSED_SPAN_MAX + 1, 0)
+        start = max(start - 1, 0)
+        end = min(end, self.CHIP8MAXMEM)
+        if start < end:
+            self._decoded[start:end] = [None] * (end - start)
+            #Idle loops span at most 6 bytes, fused entries cover more
+            if fused_start < self._heads_end:
+                heads = self._heads
+                for address in [a for a in heads if fused_start <= a < end]:
+                    del heads[address]
+
+    def tick_timers(self, cycles):
+        '''
+        Account for cycles instructions executed outside emulate_cycle,
+        ticking the timers for every frame boundary crossed.
+        '''
+        left = self.frame_cycles_left - cycles
+        while left <= 0:
+            self.timer_tick()
+            left += self.cycles_per_frame
+        self.frame_cycles_left = left
+
+    def timer_tick(self):
+        '''
+        One 60hz tick: count the delay and sound timers down.
+        '''
         if self.delay_timer > 0:
             self.delay_timer -= 1
         if self.sound_timer > 0:
@@ -196,9 +1120,16 @@ class ChipEightCpu(object):
                 self.beep_count += 1
             self.sound_timer -= 1
 
-        if self.debug and self.debug_callback:
-            self.debug_callback(self)
+    def end_frame(self):
+        '''
+        Finish the current 60hz frame: tick the timers and start counting
+        the next frame's cycles.
+        '''
+        self.frame_cycles_left = self.cycles_per_frame
+        self.timer_tick()
 
+    def invalid_opcode(self, opcode):
+        print('Unknown/Invalid opcode ' + "0x%0.4X" % opcode)
 
 
     def x0_dispatch(self, opcode):
@@ -218,9 +1149,13 @@ class ChipEightCpu(object):
         0x0000 == 0x00E0: Clears the screen
         Assuming clearing sets all gfx bits to zero
         '''
-        self.gfx = [0] * (64*32)
+        if any(self.gfx_rows):
+            self.gfx_rows[:] = BLANK_ROWS
+            self.dirty_rows = ALL_ROWS_DIRTY
+            self.frame_generation += 1
         self.pc += 2
         self.update_screen = True
+        self.draw_count += 1
 
     def ret(self, opcode):
         '''
@@ -409,39 +1344,53 @@ class ChipEightCpu(object):
         Gen number between 0x0 and 0xFF and & it with the value of kk then
         store in Vx
         '''
-        rand_byte = random.randint(0x0, 0xFF)
-        self.V[self.v_x] = rand_byte & (opcode & 0x00FF)
+        block = self._rng_block
+        if block is None:
+            self._rng_next, block = xorshift_bytes(self.rng_state, RNG_BLOCK)
+            self._rng_block = block
+        pos = self.rng_pos
+        if pos == RNG_BLOCK - 1:
+            #Block used up, the next Cxkk generates a new one
+            self.rng_state = self._rng_next
+            self._rng_block = None
+            self.rng_pos = 0
+        else:
+            self.rng_pos = pos + 1
+        self.V[self.v_x] = block[pos] & (opcode & 0x00FF)
         self.pc += 2
 
     def drw_vx_vy(self, opcode):
         '''
         DRW Vx, Vy. nibble
-        This is mostly based off other examples seen on 
-        the net.
-        TODO: test if this actually works
+        XOR an 8 x nibble sprite read from I onto the display one whole
+        row at a time, wrapping at the screen edges. VF is set when a lit
+        pixel gets erased.
         '''
-        drw_x = self.V[self.v_x]
+        drw_x = self.V[self.v_x] % SCREEN_WIDTH
         drw_y = self.V[self.v_y]
-        drw_height = opcode & 0x000F
-        sprite_data = []
-        #set VF to zero because there has been no collision yet
-        self.V[0xF] = 0
-        #Read the sprite data from memory
-        for x in range(drw_height):
-            sprite_data.append(self.memory[self.I + x])
-        for sprite_row in range(len(sprite_data)):
-            for pixel_offset in range(8):
-                new_x = (drw_x + pixel_offset) % 64
-                new_y = (drw_y + sprite_row) % 32
-                location = new_x + (new_y * 64)
-                drw_mask = 1 << (7 - pixel_offset)
-                curr_pixel = (sprite_data[sprite_row] & drw_mask) >> (7 - pixel_offset)
-                if curr_pixel:
-                    if self.gfx[location] == 1:
-                        self.V[0xF] = 1
-                    self.gfx[location] ^= 1
-                
+        rows = self.gfx_rows
+        collision = 0
+        dirty = 0
+        for sprite_row in range(opcode & 0x000F):
+            #Line the sprite byte up with the left edge of the row, then
+            #rotate it into place so pixels past column 63 wrap around.
+            sprite = self.memory[self.I + sprite_row] << (SCREEN_WIDTH - 8)
+            sprite = ((sprite >> drw_x) | (sprite << (SCREEN_WIDTH - drw_x))) & ROW_MASK
+            if not sprite:
+                #Blank sprite rows leave the display untouched
+                continue
+            y = (drw_y + sprite_row) % SCREEN_HEIGHT
+            row = rows[y]
+            if row & sprite:
+                collision = 1
+            rows[y] = row ^ sprite
+            dirty |= 1 << y
+        self.V[0xF] = collision
+        if dirty:
+            self.dirty_rows |= dirty
+            self.frame_generation += 1
         self.update_screen = True
+        self.draw_count += 1
         self.pc += 2
 
     def skp_vx(self, opcode):
@@ -524,9 +1473,12 @@ class ChipEightCpu(object):
         Fx33 - LD B, Vx
         Store BCD rep of Vx in memory locaton I/I+1/I+2
         '''
+        if self._memory_shared:
+            self.own_memory()
         self.memory[self.I] = (self.V[self.v_x] // 100) #hundreds digit
         self.memory[self.I + 1] = ((self.V[self.v_x] % 100) // 10) #tens digit
         self.memory[self.I + 2] = (self.V[self.v_x] % 10) # ones digit
+        self.invalidate_decoded(self.I, self.I + 3)
         self.pc += 2
 
     def ld_i_vx(self, opcode):
@@ -534,8 +1486,11 @@ class ChipEightCpu(object):
         Fx55 - LD [I], Vx
         Store registers V0-Vx from memory starting at location I.
         '''
+        if self._memory_shared:
+            self.own_memory()
         for registers in range(self.v_x + 1):
             self.memory[self.I + registers] = self.V[registers]
+        self.invalidate_decoded(self.I, self.I + self.v_x + 1)
         self.pc += 2
 
     def ld_vx_i(self, opcode):
@@ -555,4 +1510,13 @@ class ChipEightCpu(object):
         else:
             print('Unknown/Invalid opcode ' + str(opcode))
 
-
+    # Second level dispatchers and the opcode mask each one uses, so _resolve
+    # can resolve straight to the instruction handler.
+    _sub_dispatch_masks = {
+            x0_dispatch : 0xF0FF,
+            x8_dispatch : 0xF00F,
+            xE_dispatch : 0xF00F,
+            xF_dispatch : 0xF0FF
+    }
+    # Handlers that leave an unknown opcode where it is, run stops on them
+    _stop_handlers = frozenset([invalid_opcode, *_sub_dispatch_masks])
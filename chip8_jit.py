@@ -0,0 +1,298 @@
+#!/usr/bin/python
+'''
+Basic block compiler for ChipEightCpu.
+
+Straight-line runs of CHIP-8 instructions are translated into Python source,
+compiled once and cached by start address. A compiled block runs the whole
+run with the registers it touches held in locals, so the per-opcode fetch and
+dispatch of ChipEightCpu.emulate_cycle only happens once per block.
+
+Blocks end at anything that changes control flow (jumps, calls, ret, skips,
+Fx0A), at timer access (Fx07/Fx15/Fx18) so timers stay exact, and at memory
+writes (Fx33/Fx55) so self-modifying code is seen by the next block.
+Instructions that are not understood end the block before them and are left
+to the interpreter.
+
+The JIT ignores edits made to cpu.instruction_dispatch and falls back to
+emulate_cycle while cpu.debug is set.
+'''
+
+MAX_BLOCK_INSTRUCTIONS = 64
+
+
+class BlockJit(object):
+    def __init__(self, cpu):
+        self.cpu = cpu
+        # start address -> compiled block function
+        self.blocks = {}
+        # start address -> end address of each compiled block
+        self._ends = {}
+        # address -> start addresses of the blocks covering it
+        self._owners = {}
+        cpu.write_hooks.append(self.invalidate)
+
+    def run(self, cycles):
+        '''
+        Execute at least cycles instructions (the last block may overshoot)
+        and return the number of instructions actually executed.
+        '''
+        cpu = self.cpu
+        blocks = self.blocks
+        executed = 0
+        while executed < cycles:
+            if cpu.debug:
+                cpu.emulate_cycle()
+                executed += 1
+                continue
+            block = blocks.get(cpu.pc)
+            if block is None:
+                block = self.compile(cpu.pc)
+            executed += block(cpu)
+        return executed
+
+    def step(self):
+        '''
+        Execute the block at the current PC, returns instructions executed.
+        '''
+        return self.run(1)
+
+    def invalidate(self, start, end):
+        '''
+        Throw out every compiled block overlapping memory start to end.
+        '''
+        if end - start >= len(self.cpu.memory):
+            self.blocks.clear()
+            self._ends.clear()
+            self._owners.clear()
+            return
+        for address in range(max(start - 1, 0), end):
+            for block_start in self._owners.pop(address, ()):
+                self._drop(block_start)
+
+    def _drop(self, block_start):
+        if self.blocks.pop(block_start, None) is None:
+            return
+        for address in range(block_start, self._ends.pop(block_start)):
+            owners = self._owners.get(address)
+            if owners and block_start in owners:
+                owners.remove(block_start)
+                if not owners:
+                    del self._owners[address]
+
+    def compile(self, start):
+        '''
+        Compile the block starting at start and add it to the cache.
+        '''
+        source, end = self.translate(start)
+        if source is None:
+            block = _interpret_one
+        else:
+            namespace = {}
+            code = compile(source, '<chip8 block 0x%03X>' % start, 'exec')
+            exec(code, namespace)
+            block = namespace['block']
+        end = max(end, start + 2)
+        self.blocks[start] = block
+        self._ends[start] = end
+        for address in range(start, end):
+            self._owners.setdefault(address, []).append(start)
+        return block
+
+    def translate(self, start):
+        '''
+        Translate the block at start into Python source. Returns the source
+        and the end address of the block, or (None, start) when the first
+        instruction can't be compiled.
+        '''
+        memory = self.cpu.memory
+        body = []
+        registers = set()
+        address = start
+        count = 0
+        terminated = False
+        while count < MAX_BLOCK_INSTRUCTIONS and address + 1 < len(memory):
+            opcode = memory[address] << 8 | memory[address + 1]
+            translated = _translate_opcode(opcode, address)
+            if translated is None:
+                break
+            lines, used, kind = translated
+            registers.update(used)
+            count += 1
+            address += 2
+            if kind in (_CALLOUT, _CALLOUT_EXIT):
+                body.append(_FLUSH)
+                body.append(lines)
+                body.append(_RELOAD)
+            elif kind == _TIMER:
+                # Ticks owed by the instructions before this one have to land
+                # before the timer is read or written.
+                if count > 1:
+                    body.append(['cpu.tick_timers(%d)' % (count - 1)])
+                body.append(lines)
+                body.append(['cpu.pc = 0x%03X' % address, 'cpu.tick_timers(1)'])
+                terminated = True
+                break
+            else:
+                body.append(lines)
+            if kind in (_BRANCH, _CALLOUT_EXIT):
+                body.append(['cpu.tick_timers(%d)' % count])
+                terminated = True
+                break
+
+        if count == 0:
+            return None, start
+
+        if not terminated:
+            body.append(['cpu.pc = 0x%03X' % address,
+                         'cpu.tick_timers(%d)' % count])
+
+        registers = sorted(registers)
+        load = ['v%X = V[%d]' % (r, r) for r in registers]
+        store = ['V[%d] = v%X' % (r, r) for r in registers]
+        source = ['def block(cpu):', '    V = cpu.V']
+        source.extend('    ' + line for line in load)
+        for lines in body:
+            if lines is _FLUSH:
+                lines = store
+            elif lines is _RELOAD:
+                lines = load
+            source.extend('    ' + line for line in lines)
+        # Branches in the body only read locals, so the final write back can
+        # come after them.
+        source.extend('    ' + line for line in store)
+        source.append('    return %d' % count)
+        return '\n'.join(source) + '\n', address
+
+
+def _interpret_one(cpu):
+    cpu.emulate_cycle()
+    return 1
+
+
+# Kinds of translated instruction
+_INLINE = 0
+_CALLOUT = 1
+_BRANCH = 2
+_TIMER = 3
+# A callout that has to be the last instruction of its block
+_CALLOUT_EXIT = 4
+
+# Markers in a block body for register write back / reload around callouts
+_FLUSH = ['flush']
+_RELOAD = ['reload']
+
+
+def _translate_opcode(opcode, address):
+    '''
+    Return (lines, registers used, kind) for one instruction, or None if the
+    instruction can't be compiled.
+    '''
+    x = (opcode & 0x0F00) >> 8
+    y = (opcode & 0x00F0) >> 4
+    n = opcode & 0x000F
+    kk = opcode & 0x00FF
+    nnn = opcode & 0x0FFF
+    vx = 'v%X' % x
+    vy = 'v%X' % y
+    next_pc = address + 2
+    skip_pc = address + 4
+    family = opcode & 0xF000
+
+    def callout(handler, used=()):
+        return (['cpu.pc = 0x%03X' % address,
+                 'cpu.v_x = %d' % x,
+                 'cpu.v_y = %d' % y,
+                 'cpu.%s(0x%04X)' % (handler, opcode)], used, _CALLOUT)
+
+    def skip(condition, used):
+        return (['cpu.pc = 0x%03X if %s else 0x%03X' % (skip_pc, condition, next_pc)],
+                used, _BRANCH)
+
+    if opcode == 0x00E0:
+        return callout('cls')
+    if opcode == 0x00EE:
+        return ['cpu.pc = cpu.stack.pop()'], (), _BRANCH
+    if family == 0x1000:
+        return ['cpu.pc = 0x%03X' % nnn], (), _BRANCH
+    if family == 0x2000:
+        return (['cpu.stack.append(0x%03X)' % next_pc, 'cpu.pc = 0x%03X' % nnn],
+                (), _BRANCH)
+    if family == 0x3000:
+        return skip('%s == 0x%02X' % (vx, kk), (x,))
+    if family == 0x4000:
+        return skip('%s != 0x%02X' % (vx, kk), (x,))
+    if family == 0x5000 and n == 0:
+        return skip('%s == %s' % (vx, vy), (x, y))
+    if family == 0x6000:
+        return ['%s = 0x%02X' % (vx, kk)], (x,), _INLINE
+    if family == 0x7000:
+        return ['%s = (%s + 0x%02X) & 0xFF' % (vx, vx, kk)], (x,), _INLINE
+    if family == 0x8000:
+        # Statement order matches the interpreter handlers so VF aliasing
+        # (x or y == 0xF) gives identical results.
+        if n == 0x0:
+            lines = ['%s = %s' % (vx, vy)]
+        elif n == 0x1:
+            lines = ['%s = %s | %s' % (vx, vx, vy)]
+        elif n == 0x2:
+            lines = ['%s = %s & %s' % (vx, vx, vy)]
+        elif n == 0x3:
+            lines = ['%s = %s ^ %s' % (vx, vx, vy)]
+        elif n == 0x4:
+            lines = ['total = %s + %s' % (vx, vy),
+                     'vF = 1 if total > 0xFF else 0',
+                     '%s = total & 0xFF' % vx]
+        elif n == 0x5:
+            lines = ['vF = 1 if %s >= %s else 0' % (vx, vy),
+                     '%s = (%s - %s) & 0xFF' % (vx, vx, vy)]
+        elif n == 0x6:
+            lines = ['vF = %s & 0x1' % vx,
+                     '%s = (%s >> 1) & 0xFF' % (vx, vx)]
+        elif n == 0x7:
+            lines = ['vF = 1 if %s >= %s else 0' % (vy, vx),
+                     '%s = (%s - %s) & 0xFF' % (vx, vy, vx)]
+        elif n == 0xE:
+            lines = ['vF = (%s >> 7) & 0x1' % vx,
+                     '%s = (%s << 1) & 0xFF' % (vx, vx)]
+        else:
+            return None
+        return lines, (x, y, 0xF), _INLINE
+    if family == 0x9000 and n == 0:
+        return skip('%s != %s' % (vx, vy), (x, y))
+    if family == 0xA000:
+        return ['cpu.I = 0x%03X' % nnn], (), _INLINE
+    if family == 0xB000:
+        return ['cpu.pc = 0x%03X + v0' % nnn], (0,), _BRANCH
+    if family == 0xC000:
+        return callout('rnd_vx_byte')
+    if family == 0xD000:
+        return callout('drw_vx_vy')
+    if family == 0xE000:
+        if kk == 0x9E:
+            return skip('cpu.key[%s] == 1' % vx, (x,))
+        if kk == 0xA1:
+            return skip('cpu.key[%s] != 1' % vx, (x,))
+        return None
+    if family == 0xF000:
+        if kk == 0x07:
+            return ['%s = cpu.delay_timer' % vx], (x,), _TIMER
+        if kk == 0x15:
+            return ['cpu.delay_timer = %s' % vx], (x,), _TIMER
+        if kk == 0x18:
+            return ['cpu.sound_timer = %s' % vx], (x,), _TIMER
+        if kk == 0x0A:
+            lines, used, kind = callout('ld_vx_k')
+            return lines, used, _CALLOUT_EXIT
+        if kk == 0x1E:
+            return ['cpu.I = cpu.I + %s' % vx], (x,), _INLINE
+        if kk == 0x29:
+            return ['cpu.I = %s * 5' % vx], (x,), _INLINE
+        if kk == 0x33:
+            lines, used, kind = callout('ld_b_vx')
+            return lines, used, _CALLOUT_EXIT
+        if kk == 0x55:
+            lines, used, kind = callout('ld_i_vx')
+            return lines, used, _CALLOUT_EXIT
+        if kk == 0x65:
+            return callout('ld_vx_i')
+    return None
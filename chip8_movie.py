@@ -0,0 +1,166 @@
+#!/usr/bin/python
+'''
+Input movies: recorded keypad input for deterministic headless replays.
+
+A movie is a fixed header followed by a stream of (frame, key mask)
+events, one per change of the 16 key keypad:
+
+    header: magic, version, RNG state and position, cycles per frame and
+            the SHA-1 of the ROM it was recorded on
+    event:  32-bit frame number, 16-bit mask with bit n set while key n
+            is down
+
+The mask of an event applies from the start of that frame on. The last
+event marks the end of the recording. MovieRecorder writes a movie while
+the frontend runs (see chip8emu.EmulationThread); Movie.play replays one
+on a freshly loaded ChipEightCpu without Tk or SDL, running the frames
+between two key changes in one ChipEightCpu.run call.
+'''
+
+import hashlib
+import os
+import struct
+
+import chip8_hw
+
+MOVIE_EXTENSION = '.c8mv'
+MOVIE_MAGIC = b'C8MV'
+MOVIE_VERSION = 1
+MOVIE_HEADER = struct.Struct('<4sBIBH20s')
+MOVIE_EVENT = struct.Struct('<IH')
+
+
+def keys_to_mask(keys):
+    mask = 0
+    for index, down in enumerate(keys):
+        if down:
+            mask |= 1 << index
+    return mask
+
+
+def mask_to_keys(mask, keys):
+    '''
+    Set the keypad list keys in place from mask.
+    '''
+    keys[:] = [(mask >> index) & 1 for index in range(len(keys))]
+
+
+class MovieRecorder(object):
+    def __init__(self, out, cpu):
+        '''
+        Start recording to the binary file out. cpu must have just loaded
+        its ROM, its RNG and frame length are saved for the replay.
+        '''
+        self.out = out
+        out.write(MOVIE_HEADER.pack(
+            MOVIE_MAGIC, MOVIE_VERSION, cpu.rng_state, cpu.rng_pos,
+            cpu.cycles_per_frame, hashlib.sha1(cpu.rom).digest()))
+        self._mask = 0
+
+    def record(self, frame, keys):
+        '''
+        Note the keypad state keys at the start of frame, only changes are
+        written.
+        '''
+        mask = keys_to_mask(keys)
+        if mask != self._mask:
+            self.out.write(MOVIE_EVENT.pack(frame, mask))
+            self._mask = mask
+
+    def close(self, frame):
+        '''
+        End the recording after frame frames and close the file.
+        '''
+        self.out.write(MOVIE_EVENT.pack(frame, self._mask))
+        self.out.close()
+
+
+class Movie(object):
+    def __init__(self, source):
+        '''
+        Open a movie from a path or a binary file object. Events are read
+        from the file as they are replayed.
+        '''
+        self.source = open(source, 'rb') if isinstance(source, str) else source
+        header = self.source.read(MOVIE_HEADER.size)
+        if len(header) != MOVIE_HEADER.size:
+            raise ValueError("Movie header is truncated")
+        (magic, version, self.rng_state, self.rng_pos, self.cycles_per_frame,
+         digest) = MOVIE_HEADER.unpack(header)
+        if magic != MOVIE_MAGIC or version != MOVIE_VERSION:
+            raise ValueError("Not a CHIP-8 movie or unsupported version")
+        self.rom_digest = digest.hex()
+
+    def close(self):
+        self.source.close()
+
+    def events(self):
+        '''
+        Yield the (frame, mask) events that have not been read yet.
+        '''
+        read = self.source.read
+        size = MOVIE_EVENT.size
+        while True:
+            data = read(size)
+            if len(data) < size:
+                return
+            yield MOVIE_EVENT.unpack(data)
+
+    def play(self, cpu, max_cycles=None):
+        '''
+        Replay the movie on cpu, which must have just loaded the movie's
+        ROM. Runs to the end of the recording, or until max_cycles
+        instructions if given (holding the last keys past the end).
+        Returns a RunResult.
+        '''
+        cpu.seed_rng(self.rng_state, self.rng_pos)
+        cpu.cycles_per_frame = cpu.frame_cycles_left = self.cycles_per_frame
+        frame_cycles = self.cycles_per_frame
+        frames_start = cpu.draw_count
+        cycles = 0
+        frame = 0
+        reason = chip8_hw.STOP_MAX_CYCLES
+        events = self.events()
+        while max_cycles is None or cycles < max_cycles:
+            event = next(events, None)
+            if event is None:
+                if max_cycles is None:
+                    break
+                budget = max_cycles - cycles
+            else:
+                budget = (event[0] - frame) * frame_cycles
+                if max_cycles is not None:
+                    budget = min(budget, max_cycles - cycles)
+            #Keys only change between events, so the frames up to the next
+            #one run as a single batch.
+            result = cpu.run(max_cycles=budget, until_key_wait=False)
+            cycles += result.cycles
+            if result.cycles < budget:
+                reason = result.stop_reason
+                break
+            if event is None:
+                break
+            frame = event[0]
+            mask_to_keys(event[1], cpu.key)
+        return chip8_hw.RunResult(cycles, reason, cpu.draw_count - frames_start)
+
+
+def find_movies(paths):
+    '''
+    Map the ROM digest of every movie in the given files and directories
+    to the movie's path.
+    '''
+    movies = {}
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.path.join(dirpath, filename)
+                           for dirpath, dirnames, filenames in os.walk(path)
+                           for filename in filenames
+                           if filename.lower().endswith(MOVIE_EXTENSION))
+        else:
+            names = [path]
+        for name in names:
+            movie = Movie(name)
+            movie.close()
+            movies.setdefault(movie.rom_digest, name)
+    return movies
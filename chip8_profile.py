@@ -0,0 +1,97 @@
+#!/usr/bin/python
+'''
+Opcode and address profiling for ChipEightCpu.
+
+A Profiler installs itself on a CPU and wraps every handler in the decoded
+instruction cache, counting executions and handler time per
+instruction_dispatch key and executions per address:
+
+    profiler = Profiler(cpu)
+    cpu.run(max_cycles=1000000)
+    print(profiler.format_hot_addresses(20))
+    profiler.detach()
+
+Without a profiler the CPU caches the plain handlers, so profiling costs
+nothing when it is off. Machines forked from a profiled CPU share its
+decode cache and so report into the same profiler. The block JIT does
+not go through the decode cache and is not profiled.
+'''
+
+import collections
+import time
+
+
+class Profiler(object):
+    def __init__(self, cpu, clock=time.perf_counter):
+        self.cpu = cpu
+        self.clock = clock
+        # instruction_dispatch key -> executions / seconds spent in handler
+        self.opcode_counts = collections.Counter()
+        self.opcode_time = collections.defaultdict(float)
+        # address -> executions
+        self.address_counts = collections.Counter()
+        # address -> handler name, for the listing
+        self._names = {}
+        cpu.set_profiler(self)
+
+    def detach(self):
+        '''
+        Remove the profiler from the CPU, the counts are kept.
+        '''
+        if self.cpu.profiler is self:
+            self.cpu.set_profiler(None)
+
+    def reset(self):
+        self.opcode_counts.clear()
+        self.opcode_time.clear()
+        self.address_counts.clear()
+
+    def wrap(self, handler, key, address):
+        '''
+        Called by ChipEightCpu._decode, returns handler with counting
+        wrapped around it. The original is kept as __wrapped__.
+        '''
+        counts = self.opcode_counts
+        times = self.opcode_time
+        addresses = self.address_counts
+        clock = self.clock
+
+        def profiled(cpu, opcode):
+            start = clock()
+            handler(cpu, opcode)
+            times[key] += clock() - start
+            counts[key] += 1
+            addresses[address] += 1
+
+        profiled.__wrapped__ = handler
+        self._names[address] = getattr(handler, '__name__', repr(handler))
+        return profiled
+
+    def opcode_stats(self):
+        '''
+        (dispatch key, executions, seconds) per instruction_dispatch key,
+        most executed first.
+        '''
+        return [(key, count, self.opcode_time[key])
+                for key, count in self.opcode_counts.most_common()]
+
+    def hot_addresses(self, n=10):
+        '''
+        The n most executed addresses as (address, executions).
+        '''
+        return self.address_counts.most_common(n)
+
+    def format_hot_addresses(self, n=10):
+        '''
+        Disassembly listing of the n most executed addresses: address,
+        opcode, handler name, executions and share of all executions.
+        '''
+        memory = self.cpu.memory
+        total = sum(self.address_counts.values()) or 1
+        lines = []
+        for address, count in self.hot_addresses(n):
+            opcode = memory[address] << 8 | memory[address + 1]
+            lines.append('%03X: %04X  %-12s %10d  %5.1f%%' % (
+                address, opcode, self._names.get(address, '?'), count,
+                100.0 * count / total))
+        return '\n'.join(lines)
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+'''
+Rewind support for ChipEightCpu.
+
+RewindBuffer keeps the last few seconds of machine state in a bounded ring.
+Every keyframe_interval frames a full ChipEightCpu.snapshot is stored; the
+frames in between only store the bytes that changed since the previous
+frame, as XOR spans with the runs of unchanged (zero) bytes left out.
+Rewinding seeks back to the nearest keyframe and replays the deltas
+forward to the wanted frame.
+'''
+
+import collections
+import re
+import struct
+
+# Runs of changed bytes, merging runs separated by fewer zero bytes than a
+# span header costs.
+_CHANGED_SPANS = re.compile(rb'[^\x00]+(?:\x00{1,4}[^\x00]+)*')
+_SPAN_HEADER = struct.Struct('<HH')
+
+
+def encode_delta(old, new):
+    '''
+    Encode the difference between two equally sized states as a series of
+    (offset, length, xor bytes) spans.
+    '''
+    xor = (int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')).to_bytes(len(new), 'big')
+    parts = []
+    for match in _CHANGED_SPANS.finditer(xor):
+        parts.append(_SPAN_HEADER.pack(match.start(), match.end() - match.start()))
+        parts.append(match.group())
+    return b''.join(parts)
+
+
+def apply_delta(old, delta):
+    '''
+    Rebuild the newer state from old and a delta made by encode_delta.
+    '''
+    state = bytearray(old)
+    pos = 0
+    while pos < len(delta):
+        offset, length = _SPAN_HEADER.unpack_from(delta, pos)
+        pos += _SPAN_HEADER.size
+        span = int.from_bytes(delta[pos : pos + length], 'big') ^ \
+            int.from_bytes(state[offset : offset + length], 'big')
+        state[offset : offset + length] = span.to_bytes(length, 'big')
+        pos += length
+    return bytes(state)
+
+
+class RewindBuffer(object):
+    def __init__(self, seconds=10, frame_rate=60, keyframe_interval=60):
+        self.capacity = max(int(seconds * frame_rate), 1)
+        self.keyframe_interval = keyframe_interval
+        # (is_keyframe, data) per frame, oldest first. The oldest entry is
+        # always a keyframe.
+        self._frames = collections.deque()
+        # Full state of the newest frame, the base for the next delta
+        self._last = None
+        self._since_keyframe = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def clear(self):
+        self._frames.clear()
+        self._last = None
+        self._since_keyframe = 0
+
+    def push(self, cpu):
+        '''
+        Record the current state of cpu as the newest frame.
+        '''
+        state = cpu.snapshot()
+        if self._last is None or self._since_keyframe + 1 >= self.keyframe_interval:
+            self._frames.append((True, state))
+            self._since_keyframe = 0
+        else:
+            self._frames.append((False, encode_delta(self._last, state)))
+            self._since_keyframe += 1
+        self._last = state
+        while len(self._frames) > self.capacity:
+            self._evict()
+
+    def _evict(self):
+        is_keyframe, oldest = self._frames.popleft()
+        if self._frames and not self._frames[0][0]:
+            # Promote the new oldest frame so the ring still starts on a
+            # keyframe.
+            self._frames[0] = (True, apply_delta(oldest, self._frames[0][1]))
+
+    def state(self, frames_back=0):
+        '''
+        Full snapshot of the frame frames_back before the newest one.
+        '''
+        index = len(self._frames) - 1 - frames_back
+        if index < 0 or frames_back < 0:
+            raise IndexError("No frame %d frames back" % frames_back)
+        key_index = index
+        while not self._frames[key_index][0]:
+            key_index -= 1
+        state = self._frames[key_index][1]
+        for i in range(key_index + 1, index + 1):
+            state = apply_delta(state, self._frames[i][1])
+        return state
+
+    def rewind(self, cpu, frames=1):
+        '''
+        Restore cpu to the state frames back (or as far back as recorded)
+        and forget the newer frames. Returns how many frames were rewound.
+        '''
+        if not self._frames:
+            return 0
+        frames = min(frames, len(self._frames) - 1)
+        state = self.state(frames)
+        for _ in range(frames):
+            self._frames.pop()
+        self._last = state
+        self._since_keyframe = 0
+        for is_keyframe, data in reversed(self._frames):
+            if is_keyframe:
+                break
+            self._since_keyframe += 1
+        cpu.restore(state)
+        return frames
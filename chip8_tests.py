@@ -1,10 +1,22 @@
 #!/usr/bin/python
 #uses pytest/py.test - pytest.org
+from benchmarks import bench_cpu
+import chip8_batch
+import chip8_corpus
+import chip8_disasm
+import chip8_farm
 import chip8_hw
+import chip8_jit
+import chip8_movie
+import chip8_profile
+import chip8_rewind
 import chip8emu
 import sdl2
+import hashlib
+import json
 import os
 import pytest
+import struct
 from unittest import mock
 
 
@@ -505,6 +517,1063 @@ def test_drw_collision_when_wrapping():
     assert cpu.gfx[63] == 1
 
 
+def test_decoded_instruction_is_cached():
+    chip = initalize_system(0x61, 0x05)
+    chip.emulate_cycle()
+    handler, opcode, x, y = chip._decoded[0x200]
+    assert handler is chip8_hw.ChipEightCpu.ld_vx_byte
+    assert (opcode, x, y) == (0x6105, 1, 0)
+
+
+def test_self_modifying_write_invalidates_decode():
+    cpu = chip8_hw.ChipEightCpu()
+    # 0x200: LD V1, 0x05 / 0x202: LD B, V2 / 0x204: JP 0x200
+    cpu.memory[0x200:0x206] = b"\x61\x05\xF2\x33\x12\x00"
+    cpu.V[2] = 123
+    cpu.I = 0x200
+    cpu.emulate_cycle()
+    assert cpu.V[1] == 0x05
+    # BCD of 123 rewrites 0x200-0x202 to 01 02 03
+    cpu.emulate_cycle()
+    assert cpu._decoded[0x200] is None
+    assert cpu._decoded[0x202] is None
+    cpu.emulate_cycle()
+    assert cpu.pc == 0x200
+    cpu.emulate_cycle()
+    # 0x0102 is now an unknown 0x0NNN instruction
+    assert cpu._decoded[0x200][1] == 0x0102
+
+
+def _load_program(cpu, program):
+    cpu.memory[0x200 : 0x200 + len(program)] = program
+    return cpu
+
+
+# Exercises ALU ops (with VF aliasing), timers, BCD, Fx55/Fx65, call/ret,
+# skips and DRW, then parks in a jump-to-self loop at 0x22C.
+JIT_TEST_PROGRAM = bytes([
+    0x60, 0x05,  # 200: LD V0, 0x05
+    0x61, 0xFA,  # 202: LD V1, 0xFA
+    0x80, 0x14,  # 204: ADD V0, V1
+    0x8F, 0x15,  # 206: SUB VF, V1
+    0x82, 0x0E,  # 208: SHL V2, V0
+    0x63, 0x20,  # 20A: LD V3, 0x20
+    0xF3, 0x15,  # 20C: LD DT, V3
+    0x73, 0x01,  # 20E: ADD V3, 0x01
+    0xF4, 0x07,  # 210: LD V4, DT
+    0xA3, 0x00,  # 212: LD I, 0x300
+    0xF3, 0x33,  # 214: LD B, V3
+    0xF2, 0x65,  # 216: LD V2, [I]
+    0x22, 0x30,  # 218: CALL 0x230
+    0xF4, 0x07,  # 21A: LD V4, DT
+    0x34, 0x00,  # 21C: SE V4, 0x00
+    0x12, 0x1A,  # 21E: JP 0x21A
+    0xF3, 0x29,  # 220: LD F, V3
+    0xD0, 0x15,  # 222: DRW V0, V1, 5
+    0xA3, 0x10,  # 224: LD I, 0x310
+    0xF5, 0x55,  # 226: LD [I], V5
+    0x00, 0xE0,  # 228: CLS
+    0xD0, 0x15,  # 22A: DRW V0, V1, 5
+    0x12, 0x2C,  # 22C: JP 0x22C
+    0x00, 0x00,  # 22E: (data)
+    0x85, 0x30,  # 230: LD V5, V3
+    0x00, 0xEE,  # 232: RET
+])
+
+
+def test_jit_matches_interpreter():
+    interpreted = _load_program(chip8_hw.ChipEightCpu(), JIT_TEST_PROGRAM)
+    compiled = _load_program(chip8_hw.ChipEightCpu(), JIT_TEST_PROGRAM)
+    jit = chip8_jit.BlockJit(compiled)
+
+    executed = jit.run(400)
+    for _ in range(executed):
+        interpreted.emulate_cycle()
+
+    assert compiled.pc == interpreted.pc == 0x22C
+    assert compiled.V == interpreted.V
+    assert compiled.I == interpreted.I
+    assert compiled.stack == interpreted.stack
+    assert compiled.delay_timer == interpreted.delay_timer
+    assert compiled.memory == interpreted.memory
+    assert compiled.gfx == interpreted.gfx
+
+
+def test_jit_invalidates_block_on_self_modifying_write():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), bytes([
+        0x61, 0x01,  # 200: LD V1, 0x01
+        0x60, 0x63,  # 202: LD V0, 0x63
+        0xA2, 0x01,  # 204: LD I, 0x201
+        0xF0, 0x55,  # 206: LD [I], V0 (rewrites 0x201 -> LD V1, 0x63)
+        0x12, 0x00,  # 208: JP 0x200
+    ]))
+    jit = chip8_jit.BlockJit(cpu)
+    jit.run(4)
+    assert cpu.V[1] == 0x01
+    assert 0x200 not in jit.blocks
+    jit.run(1)
+    jit.run(1)
+    assert cpu.V[1] == 0x63
+
+
+def test_drw_xors_packed_rows():
+    cpu = chip8_hw.ChipEightCpu()
+    cpu.I = 0x300
+    cpu.memory[0x300] = 0b10100000
+    cpu.v_x = 1
+    cpu.v_y = 2
+    cpu.V[1] = 4
+    cpu.V[2] = 3
+    cpu.drw_vx_vy(0xD121)
+    assert cpu.gfx_rows[3] == 0b101 << (64 - 7)
+    assert cpu.V[0xF] == 0
+    cpu.drw_vx_vy(0xD121)
+    assert cpu.gfx_rows[3] == 0
+    assert cpu.V[0xF] == 1
+
+
+def test_cls_clears_rows_in_place():
+    chip = initalize_system(0x00, 0xE0)
+    rows = chip.gfx_rows
+    chip.gfx[5] = 1
+    assert rows[0] == 1 << 58
+    chip.emulate_cycle()
+    assert chip.gfx_rows is rows
+    assert rows == [0] * 32
+
+
+def test_batch_matches_interpreter():
+    batch = chip8_batch.BatchChipEightCpu(3)
+    batch.load_program(JIT_TEST_PROGRAM)
+    cpu = _load_program(chip8_hw.ChipEightCpu(), JIT_TEST_PROGRAM)
+    for _ in range(150):
+        batch.step()
+        cpu.emulate_cycle()
+
+    for machine in range(3):
+        state = batch.to_cpu(machine)
+        assert state.pc == cpu.pc
+        assert state.V == cpu.V
+        assert state.I == cpu.I
+        assert state.stack == cpu.stack
+        assert state.delay_timer == cpu.delay_timer
+        assert state.memory == cpu.memory
+        assert state.gfx_rows == cpu.gfx_rows
+
+
+def test_batch_machines_diverge_on_keys_and_seeds():
+    batch = chip8_batch.BatchChipEightCpu(2, seeds=[7, 7])
+    # 200: LD V1, K / 202: RND V2, 0xFF / 204: JP 0x204
+    batch.load_program(b"\xF1\x0A\xC2\xFF\x12\x04")
+    batch.key[0, 0x5] = 1
+    batch.step()
+    assert list(batch.pc) == [0x202, 0x200]
+    assert batch.V[0, 1] == 0x5
+    batch.key[1, 0x5] = 1
+    batch.step()
+    batch.step()
+    # Same seed, same random byte despite running a step apart
+    assert batch.V[0, 2] == batch.V[1, 2]
+
+
+def test_run_stop_conditions():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), bytes([
+        0x60, 0x00,  # 200: LD V0, 0x00
+        0x70, 0x01,  # 202: ADD V0, 0x01
+        0xD0, 0x01,  # 204: DRW V0, V0, 1
+        0x30, 0x05,  # 206: SE V0, 0x05
+        0x12, 0x02,  # 208: JP 0x202
+        0xF1, 0x0A,  # 20A: LD V1, K
+        0x12, 0x0A,  # 20C: JP 0x20A
+    ]))
+    result = cpu.run(max_cycles=3)
+    assert result == chip8_hw.RunResult(3, chip8_hw.STOP_MAX_CYCLES, 1)
+
+    result = cpu.run(until_frame=2)
+    assert result == chip8_hw.RunResult(8, chip8_hw.STOP_FRAME, 2)
+    assert cpu.pc == 0x206
+
+    result = cpu.run(until_pc=0x20A)
+    assert result.stop_reason == chip8_hw.STOP_PC
+    assert cpu.V[0] == 5
+
+    result = cpu.run(max_cycles=1000)
+    assert result == chip8_hw.RunResult(1, chip8_hw.STOP_KEY_WAIT, 0)
+    assert cpu.pc == 0x20A
+
+    result = cpu.run(max_cycles=10, until_key_wait=False)
+    assert result == chip8_hw.RunResult(10, chip8_hw.STOP_MAX_CYCLES, 0)
+
+
+def test_run_stops_on_invalid_opcode():
+    chip = initalize_system(0x01, 0x23)
+    result = chip.run(max_cycles=100)
+    assert result.stop_reason == chip8_hw.STOP_INVALID_OPCODE
+    assert result.cycles == 1
+
+
+def _write_farm_roms(tmp_path):
+    roms = tmp_path / "roms"
+    roms.mkdir()
+    # Draws the font glyph for V0 then spins
+    (roms / "a.ch8").write_bytes(b"\x60\x03\xF0\x29\xD1\x15\x12\x06")
+    # Waits for a key
+    (roms / "b.ch8").write_bytes(b"\xF0\x0A")
+    (roms / "notes.txt").write_text("not a rom")
+    return roms
+
+
+def test_farm_report(tmp_path):
+    roms = _write_farm_roms(tmp_path)
+    report = tmp_path / "report.json"
+    assert chip8_farm.main([str(roms), "--cycles", "1e3", "--workers", "1",
+                            "--output", str(report)]) == 0
+    rows = json.loads(report.read_text())
+    assert [os.path.basename(row["rom"]) for row in rows] == ["a.ch8", "b.ch8"]
+    assert rows[0]["cycles"] == 1000
+    assert rows[0]["frames"] == 1
+    assert rows[0]["stop_reason"] == chip8_hw.STOP_MAX_CYCLES
+    assert rows[1]["stop_reason"] == chip8_hw.STOP_KEY_WAIT
+    assert rows[0]["framebuffer_hash"] != rows[1]["framebuffer_hash"]
+    assert rows[0]["error"] is None
+
+
+def test_farm_process_pool_is_deterministic(tmp_path):
+    roms = chip8_farm.find_roms([str(_write_farm_roms(tmp_path))])
+    serial = chip8_farm.run_farm(roms, 500, workers=1)
+    pooled = chip8_farm.run_farm(roms, 500, workers=2)
+    for a, b in zip(serial, pooled):
+        a.pop("wall_time")
+        b.pop("wall_time")
+    assert serial == pooled
+
+
+def test_snapshot_restore_round_trip():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), JIT_TEST_PROGRAM)
+    cpu.run(max_cycles=120)
+    cpu.key[3] = 1
+    saved = cpu.snapshot()
+    assert len(saved) == chip8_hw.SNAPSHOT_FORMAT.size
+    expected = (bytes(cpu.memory), list(cpu.V), cpu.I, cpu.pc, list(cpu.stack),
+                cpu.delay_timer, list(cpu.key), list(cpu.gfx_rows), cpu.draw_count)
+
+    memory = cpu.memory
+    cpu.run(max_cycles=50)
+    cpu.key[3] = 0
+    cpu.restore(saved)
+
+    assert cpu.memory is memory
+    assert (bytes(cpu.memory), list(cpu.V), cpu.I, cpu.pc, list(cpu.stack),
+            cpu.delay_timer, list(cpu.key), list(cpu.gfx_rows), cpu.draw_count) == expected
+    assert cpu.snapshot() == saved
+
+
+def test_restore_invalidates_only_changed_memory():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), JIT_TEST_PROGRAM)
+    cpu.run(max_cycles=20)
+    saved = cpu.snapshot()
+    writes = []
+    cpu.write_hooks.append(lambda start, end: writes.append((start, end)))
+
+    cpu.restore(saved)
+    assert writes == []
+    assert cpu._decoded[0x200] is not None
+
+    cpu.memory[0x400] = 0xAA
+    cpu.memory[0x610:0x613] = b"\x01\x00\x02"
+    cpu.restore(saved)
+    assert writes == [(0x400, 0x401), (0x610, 0x613)]
+    assert cpu._decoded[0x200] is not None
+    assert cpu.snapshot() == saved
+
+
+def test_restore_rejects_bad_snapshot():
+    cpu = chip8_hw.ChipEightCpu()
+    saved = cpu.snapshot()
+    with pytest.raises(ValueError):
+        cpu.restore(saved[:-1])
+    with pytest.raises(ValueError):
+        cpu.restore(b"XXXX" + saved[4:])
+
+
+def test_fork_shares_memory_until_write():
+    parent = _load_program(chip8_hw.ChipEightCpu(), bytes([
+        0x60, 0x7B,  # 200: LD V0, 123
+        0xA3, 0x00,  # 202: LD I, 0x300
+        0xF0, 0x33,  # 204: LD B, V0
+        0x12, 0x06,  # 206: JP 0x206
+    ]))
+    parent.run(max_cycles=2)
+    child = parent.fork()
+    assert child.memory is parent.memory
+    assert child._decoded is parent._decoded
+    assert "instruction_dispatch" not in vars(child)
+
+    child.run(max_cycles=1)
+    assert child.memory is not parent.memory
+    assert child.memory[0x300:0x303] == b"\x01\x02\x03"
+    assert parent.memory[0x300:0x303] == b"\x00\x00\x00"
+
+    child.V[0] = 1
+    assert parent.V[0] == 123
+    parent.run(max_cycles=1)
+    assert parent.memory[0x300:0x303] == b"\x01\x02\x03"
+    assert parent.pc == child.pc == 0x206
+
+
+def test_fork_shares_decode_caches_until_a_new_decode():
+    parent = _load_program(chip8_hw.ChipEightCpu(), bytes([
+        0x60, 0x7B,  # 200: LD V0, 123
+        0xA3, 0x00,  # 202: LD I, 0x300
+        0xF0, 0x33,  # 204: LD B, V0
+        0x12, 0x04,  # 206: JP 0x204
+    ]))
+    parent.run(max_cycles=4)
+    child = parent.fork()
+
+    # Writing data takes a copy of memory only
+    child.run(max_cycles=2)
+    assert child.memory is not parent.memory
+    assert child._decoded is parent._decoded
+
+    # Self-modifying code is cleared in the shared cache and decoded into
+    # a private one
+    child.own_memory()
+    child.memory[0x206:0x208] = b"\x12\x08"
+    child.invalidate_decoded(0x206, 0x208)
+    child.run(max_cycles=2)
+    assert child._decoded is not parent._decoded
+    assert child.pc == 0x208
+    parent.run(max_cycles=2)
+    assert parent.pc == 0x204
+
+
+def test_run_decodes_code_a_forked_machine_rewrites():
+    parent = _load_program(chip8_hw.ChipEightCpu(), bytes([
+        0x60, 0x62,  # 200: LD V0, 0x62
+        0x61, 0x01,  # 202: LD V1, 0x01
+        0xA2, 0x08,  # 204: LD I, 0x208
+        0xF1, 0x55,  # 206: LD [I], V1
+        0x62, 0x03,  # 208: LD V2, 0x03, rewritten to LD V2, 0x01
+        0x12, 0x0A,  # 20A: JP 0x20A
+    ]))
+    parent.run(max_cycles=2)
+    parent.predecode([0x206, 0x208, 0x20A])
+    child = parent.fork()
+
+    # Decoding 0x204 gives the child caches of its own in the middle of
+    # run, which must then see the rewrite of 0x208 in them
+    assert child.run(max_cycles=50, until_key_wait=False).cycles == 50
+    assert child.pc == 0x20A and child.V[2] == 0x01
+    assert parent.memory[0x208:0x20A] == b"\x62\x03"
+    assert parent._decoded[0x208][1] == 0x6203
+
+
+def test_rewind_buffer_restores_past_frames():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), JIT_TEST_PROGRAM)
+    rewind = chip8_rewind.RewindBuffer(seconds=1, frame_rate=40, keyframe_interval=8)
+    history = []
+    for _ in range(100):
+        cpu.run(max_cycles=3)
+        rewind.push(cpu)
+        history.append(cpu.snapshot())
+
+    assert len(rewind) == 40
+    assert rewind._frames[0][0] is True
+    assert rewind.state(0) == history[-1]
+    assert rewind.state(39) == history[-40]
+
+    assert rewind.rewind(cpu, 10) == 10
+    assert cpu.snapshot() == history[-11]
+    assert len(rewind) == 30
+
+    # Recording continues from the rewound state
+    cpu.run(max_cycles=3)
+    rewind.push(cpu)
+    assert rewind.state(0) == cpu.snapshot()
+    assert rewind.state(1) == history[-11]
+
+
+def test_rewind_delta_only_stores_changes():
+    old = bytes(100)
+    new = bytearray(old)
+    new[10] = 1
+    new[12] = 2
+    new[90] = 3
+    delta = chip8_rewind.encode_delta(old, bytes(new))
+    assert len(delta) < 20
+    assert chip8_rewind.apply_delta(old, delta) == bytes(new)
+
+
+def test_timers_tick_at_60hz_of_emulated_time():
+    cpu = chip8_hw.ChipEightCpu(cycles_per_frame=10)
+    # 200: JP 0x200
+    cpu.memory[0x200:0x202] = b"\x12\x00"
+    cpu.delay_timer = 5
+    cpu.sound_timer = 2
+    for _ in range(9):
+        cpu.emulate_cycle()
+    assert cpu.delay_timer == 5
+    cpu.emulate_cycle()
+    assert cpu.delay_timer == 4
+    assert cpu.run(max_cycles=25).cycles == 25
+    assert cpu.delay_timer == 2
+    assert cpu.sound_timer == 0
+    assert cpu.beep_count == 1
+    assert cpu.frame_cycles_left == 5
+
+
+def test_run_frame_and_tick_timers():
+    cpu = chip8_hw.ChipEightCpu(cycles_per_frame=10)
+    cpu.memory[0x200:0x202] = b"\x12\x00"
+    cpu.delay_timer = 5
+    cpu.emulate_cycle()
+    assert cpu.run_frame() == 9
+    assert cpu.delay_timer == 4
+    assert cpu.frame_cycles_left == 10
+    cpu.tick_timers(25)
+    assert cpu.delay_timer == 2
+    assert cpu.frame_cycles_left == 5
+
+
+def test_frame_scheduler_batches_and_caps_catch_up():
+    scheduler = chip8emu.FrameScheduler(frame_hz=60.0, max_catchup=4, now=0.0)
+    assert scheduler.frames_due(0.0) == 1
+    assert scheduler.frames_due(0.010) == 0
+    assert scheduler.frames_due(0.017) == 1
+    assert scheduler.frames_due(0.060) == 2
+    # A one second stall only runs the capped number of frames
+    assert scheduler.frames_due(1.060) == 4
+    assert scheduler.frames_due(1.061) == 0
+    assert scheduler.frames_due(1.060 + 1 / 60.0) == 1
+
+
+def test_update_framebuffer_converts_dirty_rows_only():
+    cpu = chip8_hw.ChipEightCpu()
+    framebuffer = bytearray(chip8emu.ROW_BYTES * chip8emu.CHIP8_HEIGHT)
+    assert chip8emu.update_framebuffer(cpu, framebuffer) == (0, 32)
+    assert chip8emu.update_framebuffer(cpu, framebuffer) is None
+
+    cpu.I = 0x300
+    cpu.memory[0x300] = 0b10000000
+    cpu.v_x = 1
+    cpu.v_y = 2
+    cpu.V[1] = 1
+    cpu.V[2] = 5
+    cpu.drw_vx_vy(0xD121)
+    assert cpu.dirty_rows == 1 << 5
+    framebuffer[0:4] = b"junk"
+    assert chip8emu.update_framebuffer(cpu, framebuffer) == (5, 1)
+    assert framebuffer[0:4] == b"junk"
+
+    def pixel(x, y):
+        offset = y * chip8emu.ROW_BYTES + x * 4
+        return struct.unpack("=I", framebuffer[offset : offset + 4])[0]
+
+    assert pixel(1, 5) == chip8emu.PIXEL_ON
+    assert pixel(0, 5) == chip8emu.PIXEL_OFF
+
+
+def test_frame_generation_only_moves_on_display_change():
+    cpu = chip8_hw.ChipEightCpu()
+    cpu.dirty_rows = 0
+    generation = cpu.frame_generation
+    cpu.cls(0x00E0)
+    assert cpu.frame_generation == generation
+    assert cpu.dirty_rows == 0
+
+    cpu.I = 0x300
+    cpu.memory[0x300:0x302] = b'\x00\xff'
+    cpu.v_x = 0
+    cpu.v_y = 1
+    cpu.drw_vx_vy(0xD011)
+    assert cpu.frame_generation == generation
+    cpu.drw_vx_vy(0xD012)
+    assert cpu.frame_generation == generation + 1
+    assert cpu.dirty_rows == 1 << 1
+
+    cpu.cls(0x00E0)
+    assert cpu.frame_generation == generation + 2
+    assert cpu.dirty_rows == chip8_hw.ALL_ROWS_DIRTY
+
+
+def test_frame_exchange_keeps_newest_frame_and_merges_dirty_rows():
+    cpu = chip8_hw.ChipEightCpu()
+    exchange = chip8emu.FrameExchange()
+    assert exchange.take() is None
+
+    cpu.dirty_rows = 1 << 3
+    exchange.publish(cpu)
+    cpu.gfx_rows[7] = 1
+    cpu.dirty_rows = 1 << 7
+    cpu.frame_generation += 1
+    exchange.publish(cpu)
+
+    frame = exchange.take()
+    assert frame.dirty_rows == (1 << 3) | (1 << 7)
+    assert frame.gfx_rows == cpu.gfx_rows
+    assert frame.gfx_rows is not cpu.gfx_rows
+    assert frame.frame_generation == cpu.frame_generation
+    assert cpu.dirty_rows == 0
+    assert exchange.take() is None
+
+
+def test_emulation_thread_applies_events_between_frames():
+    cpu = chip8_hw.ChipEightCpu(cycles_per_frame=4)
+    _load_program(cpu, bytes([0x12, 0x00]))
+    emulator = chip8emu.EmulationThread(chip8_hw.ChipEightCpu())
+    emulator.load(cpu)
+    emulator.key_event(sdl2.SDLK_1, True)
+    emulator.process_events(timeout=0)
+    assert emulator.cpu is cpu
+    assert cpu.key[0x1] == 1
+
+    emulator.run_frames(2)
+    assert emulator.cycles_executed == 8
+    assert len(emulator.rewind) == 2
+    assert emulator.frames.take().frame_generation == cpu.frame_generation
+
+    emulator.toggle_pause()
+    emulator.step()
+    emulator.process_events(timeout=0)
+    assert emulator.cycles_executed == 9
+    emulator.run_frames(1)
+    assert emulator.cycles_executed == 9
+
+    emulator.toggle_pause()
+    emulator.start()
+    emulator.stop()
+    emulator.join(timeout=5)
+    assert not emulator.is_alive()
+
+
+def test_benchmark_workloads_run_their_full_budget(tmp_path):
+    output = tmp_path / 'bench.json'
+    assert bench_cpu.main(['--cycles', '500', '--repeat', '1', '--engine', 'interpreter',
+                           '--engine', 'jit', '--output', str(output)]) == 0
+    results = json.loads(output.read_text())['results']
+    # The step loop baseline runs on every workload
+    assert len(results) == 3 * len(bench_cpu.WORKLOADS)
+    for row in results:
+        assert row['stop_reason'] == chip8_hw.STOP_MAX_CYCLES
+        assert row['cycles'] >= 500
+        assert row['ips'] > 0
+        assert row['vs_step'] > 0
+    assert [row['engine'] for row in results[:3]] == ['step', 'interpreter', 'jit']
+    assert results[0]['vs_step'] == 1.0
+
+
+def test_profiler_counts_opcodes_and_addresses():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), bytes([
+        0x60, 0x00,  # 200: LD V0, 0x00
+        0x70, 0x01,  # 202: ADD V0, 0x01
+        0x80, 0x14,  # 204: ADD V0, V1
+        0x12, 0x02,  # 206: JP 0x202
+    ]))
+    cpu.run(max_cycles=10)
+    profiler = chip8_profile.Profiler(cpu)
+    cpu.run(max_cycles=31)
+
+    # Decodes cached before the profiler was installed are not reused
+    assert profiler.opcode_counts == {0x7000: 11, 0x8004: 10, 0x1000: 10}
+    assert sum(profiler.address_counts.values()) == 31
+    assert profiler.hot_addresses(1) == [(0x202, 11)]
+    assert profiler.opcode_stats()[0][:2] == (0x7000, 11)
+    listing = profiler.format_hot_addresses(3).splitlines()
+    assert len(listing) == 3
+    assert listing[0].startswith('202: 7001  add_vx_byte')
+
+    profiler.detach()
+    cpu.run(max_cycles=5)
+    assert sum(profiler.address_counts.values()) == 31
+
+
+def test_run_stops_on_invalid_opcode_while_profiled():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), bytes([0x00, 0x00]))
+    chip8_profile.Profiler(cpu)
+    result = cpu.run(max_cycles=10)
+    assert result.stop_reason == chip8_hw.STOP_INVALID_OPCODE
+
+
+def test_debug_observer_throttles_and_only_sets_changed_labels():
+    now = [0.0]
+    updates = []
+    observer = chip8emu.DebugObserver(lambda name, text: updates.append((name, text)),
+                                      rate_hz=30, clock=lambda: now[0])
+    cpu = chip8_hw.ChipEightCpu()
+    perf = {"cps": 0, "fps": 0}
+    assert observer.sample(cpu, perf) == len(chip8emu.debug_texts(cpu, perf))
+
+    del updates[:]
+    cpu.V[3] = 0xAB
+    now[0] = 0.01
+    assert observer.sample(cpu, perf) == 0
+    now[0] = 0.04
+    assert observer.sample(cpu, perf) == 1
+    assert updates == [("V3", "AB")]
+    assert observer.sample(cpu, perf, force=True) == 0
+
+
+def test_rom_hex_dump():
+    assert chip8emu.rom_hex_dump(bytes(range(18))) == (
+        "200: 00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F\n"
+        "210: 10 11\n"
+    )
+
+
+def test_disasm_builds_blocks_and_separates_data():
+    rom = bytes([
+        0x60, 0x00,  # 200: LD V0, 0x00
+        0x22, 0x0A,  # 202: CALL 0x20A
+        0x30, 0x05,  # 204: SE V0, 0x05
+        0x12, 0x02,  # 206: JP 0x202
+        0x12, 0x08,  # 208: JP 0x208
+        0x70, 0x01,  # 20A: ADD V0, 0x01
+        0xD0, 0x15,  # 20C: DRW V0, V1, 5
+        0x00, 0xEE,  # 20E: RET
+        0xDE, 0xAD, 0xBE,
+    ])
+    cfg = chip8_disasm.build_cfg(rom)
+    assert sorted(cfg.blocks) == [0x200, 0x202, 0x204, 0x206, 0x208, 0x20A]
+    assert cfg.blocks[0x202].successors == [0x20A, 0x204]
+    assert cfg.blocks[0x204].successors == [0x206, 0x208]
+    assert cfg.blocks[0x20A].end == 0x210
+    assert cfg.blocks[0x20A].successors == []
+    assert str(cfg.instructions[0x20C]) == '20C: D015  drw_vx_vy V0, V1, 5'
+    assert cfg.data_ranges() == [(0x210, 0x213)]
+    assert not cfg.is_code(0x210)
+    assert '210: db DE AD BE' in cfg.listing()
+
+    cpu = chip8_hw.ChipEightCpu()
+    cpu.memory[0x200 : 0x200 + len(rom)] = rom
+    cpu.rom = bytearray(rom)
+    chip8_disasm.predecode(cpu, cfg)
+    assert cpu._decoded[0x20C][0] is chip8_hw.ChipEightCpu.drw_vx_vy
+    assert cpu._decoded[0x210] is None
+
+
+# Polls the delay timer, then waits for a key forever.
+IDLE_TEST_PROGRAM = bytes([
+    0x60, 0x07,  # 200: LD V0, 0x07
+    0xF0, 0x15,  # 202: LD DT, V0
+    0xF1, 0x07,  # 204: LD V1, DT
+    0x31, 0x00,  # 206: SE V1, 0x00
+    0x12, 0x04,  # 208: JP 0x204
+    0x72, 0x01,  # 20A: ADD V2, 0x01
+    0xF3, 0x0A,  # 20C: LD V3, K
+])
+
+
+def test_idle_loop_skipping_matches_stepping():
+    stepped = _load_program(chip8_hw.ChipEightCpu(seed=1), IDLE_TEST_PROGRAM)
+    for _ in range(200):
+        stepped.emulate_cycle()
+
+    ran = _load_program(chip8_hw.ChipEightCpu(seed=1), IDLE_TEST_PROGRAM)
+    result = ran.run(max_cycles=200, until_key_wait=False)
+    assert result.cycles == 200
+    assert ran.snapshot() == stepped.snapshot()
+
+    framed = _load_program(chip8_hw.ChipEightCpu(cycles_per_frame=10, seed=1), IDLE_TEST_PROGRAM)
+    assert sum(framed.run_frame() for _ in range(20)) == 200
+    stepped = _load_program(chip8_hw.ChipEightCpu(cycles_per_frame=10, seed=1), IDLE_TEST_PROGRAM)
+    for _ in range(200):
+        stepped.emulate_cycle()
+    assert framed.snapshot() == stepped.snapshot()
+
+
+def test_skip_idle_only_skips_loops_that_cannot_exit():
+    cpu = _load_program(chip8_hw.ChipEightCpu(), IDLE_TEST_PROGRAM)
+    cpu.run(max_cycles=5)
+    assert cpu.pc == 0x204
+    poll = cpu._heads[0x204][0]
+    assert poll == (chip8_hw.ChipEightCpu.ld_vx_dt, 1, 0x00, False)
+    assert cpu._skip_idle(poll, 8) == 6
+    cpu.delay_timer = 0
+    assert cpu._skip_idle(poll, 8) == 0
+
+    cpu.run(max_cycles=10)
+    assert cpu.pc == 0x20C
+    wait = cpu._idle_loop(0x20C)
+    assert cpu._skip_idle(wait, 8) == 8
+    cpu.key[5] = 1
+    assert cpu._skip_idle(wait, 8) == 0
+
+    # Other loop heads are classified once and cached
+    assert cpu._loop_head(0x200) == chip8_hw.PLAIN_HEAD
+    assert cpu._heads[0x200] == chip8_hw.PLAIN_HEAD
+    cpu.memory[0x209] = 0x06
+    cpu.invalidate_decoded(0x209, 0x20A)
+    assert 0x204 not in cpu._heads
+    assert 0x200 in cpu._heads
+    assert cpu._idle_loop(0x204) == chip8_hw.NOT_IDLE
+
+
+def test_rng_is_seeded_per_cpu_and_saved_in_snapshots():
+    # 200: RND V0, 0xFF / 202: JP 0x200
+    program = bytes([0xC0, 0xFF, 0x12, 0x00])
+
+    def draws(cpu, count):
+        values = []
+        for _ in range(count):
+            cpu.emulate_cycle()
+            values.append(cpu.V[0])
+            cpu.emulate_cycle()
+        return values
+
+    first = _load_program(chip8_hw.ChipEightCpu(seed=42), program)
+    second = _load_program(chip8_hw.ChipEightCpu(seed=42), program)
+    stream = draws(first, 300)
+    assert draws(second, 300) == stream
+    assert stream != draws(_load_program(chip8_hw.ChipEightCpu(seed=43), program), 300)
+
+    # Matches the batch generator and carries over the block boundary
+    assert bytes(stream[:chip8_hw.RNG_BLOCK]) == chip8_hw.xorshift_bytes(42, chip8_hw.RNG_BLOCK)[1]
+
+    saved = first.snapshot()
+    ahead = draws(first, 20)
+    first.restore(saved)
+    assert draws(first, 20) == ahead
+
+    # seed_rng picks a saved position up where it left off
+    state, pos = first.rng_state, first.rng_pos
+    ahead = draws(first, 20)
+    second.seed_rng(state, pos)
+    assert draws(second, 20) == ahead
+
+
+def test_batch_to_cpu_continues_random_stream():
+    batch = chip8_batch.BatchChipEightCpu(1, seeds=[9])
+    batch.load_program(b"\xC0\xFF\x12\x00")
+    batch.step()
+    cpu = batch.to_cpu(0)
+    batch.step()
+    batch.step()
+    cpu.emulate_cycle()
+    cpu.emulate_cycle()
+    assert cpu.V[0] == batch.V[0, 0]
+
+
+def test_corpus_maps_files_and_archives_by_hash(tmp_path):
+    roms = tmp_path / 'roms'
+    roms.mkdir()
+    (roms / 'a.ch8').write_bytes(b'\x60\x01\x12\x02')
+    (roms / 'b.ch8').write_bytes(b'\x61\x02')
+    (roms / 'copy.ch8').write_bytes(b'\x60\x01\x12\x02')
+    (roms / 'notes.txt').write_bytes(b'not a rom')
+
+    corpus = chip8_corpus.RomCorpus([str(roms)])
+    assert len(corpus) == 2
+    digest = hashlib.sha1(b'\x60\x01\x12\x02').hexdigest()
+    assert sorted(corpus.paths[digest]) == [str(roms / 'a.ch8'), str(roms / 'copy.ch8')]
+    assert corpus[digest].readonly
+
+    cpu = chip8_hw.ChipEightCpu()
+    cpu.V[5] = 9
+    corpus.load(cpu, digest)
+    assert cpu.V[5] == 0
+    assert cpu.memory[0x200:0x204] == b'\x60\x01\x12\x02'
+    assert cpu.rom == b'\x60\x01\x12\x02'
+
+    archive = tmp_path / 'roms.c8ra'
+    chip8_corpus.write_archive(str(archive), chip8_corpus.find_roms([str(roms)]))
+    packed = chip8_corpus.RomCorpus([str(archive)])
+    assert sorted(packed) == sorted(corpus)
+    assert bytes(packed[digest]) == bytes(corpus[digest])
+
+
+def test_corpus_keeps_no_file_open_per_rom(tmp_path):
+    '''
+    More ROMs than the process may hold files open, read into shared
+    arenas with duplicates stored once.
+    '''
+    resource = pytest.importorskip('resource')
+    limit = 64
+    roms = tmp_path / 'roms'
+    roms.mkdir()
+    for i in range(limit * 3):
+        (roms / ('%03d.ch8' % i)).write_bytes(bytes([0x60, i % 150, 0x12, 0x02]))
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+    try:
+        corpus = chip8_corpus.RomCorpus([str(roms)])
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert len(corpus) == 150
+    assert len(corpus.paths[hashlib.sha1(b'\x60\x00\x12\x02').hexdigest()]) == 2
+    assert corpus._arena._used == 150 * 4
+    for digest in corpus:
+        rom = corpus[digest]
+        assert rom.readonly
+        assert hashlib.sha1(rom).hexdigest() == digest
+
+
+def test_movie_replay_matches_live_input(tmp_path):
+    '''
+    A movie recorded while stepping frames with live key changes replays to
+    the same machine state headless, from a differently seeded CPU, and
+    the farm replays it for the ROM it was recorded on.
+    '''
+    program = bytes([
+        0xF0, 0x0A,  # 200: LD V0, K
+        0x81, 0x04,  # 202: ADD V1, V0
+        0xC2, 0xFF,  # 204: RND V2, 0xFF
+        0x82, 0x24,  # 206: ADD V2, V2
+        0x12, 0x00,  # 208: JP 0x200
+    ])
+    rom_path = tmp_path / 'keys.ch8'
+    rom_path.write_bytes(program)
+    movie_path = str(tmp_path / 'keys.c8mv')
+    live = chip8_hw.ChipEightCpu(seed=5)
+    live.load_rom_data(program)
+    recorder = chip8_movie.MovieRecorder(open(movie_path, 'wb'), live)
+    presses = {3: (4, 1), 7: (4, 0), 12: (0xA, 1), 13: (0xA, 1), 20: (0xA, 0)}
+    for frame in range(30):
+        if frame in presses:
+            key, down = presses[frame]
+            live.key[key] = down
+            recorder.record(frame, live.key)
+        live.run_frame()
+    recorder.close(30)
+    # Frame 13 repeats the held key, only changes are stored
+    assert os.path.getsize(movie_path) == \
+        chip8_movie.MOVIE_HEADER.size + 5 * chip8_movie.MOVIE_EVENT.size
+
+    replay = chip8_hw.ChipEightCpu(seed=99)
+    replay.load_rom_data(program)
+    movie = chip8_movie.Movie(movie_path)
+    result = movie.play(replay)
+    movie.close()
+    assert result.cycles == 30 * live.cycles_per_frame
+    assert result.stop_reason == chip8_hw.STOP_MAX_CYCLES
+    assert replay.snapshot() == live.snapshot()
+
+    movies = chip8_movie.find_movies([str(tmp_path)])
+    assert movies == {hashlib.sha1(program).hexdigest(): movie_path}
+    row = chip8_farm.run_rom(str(rom_path), 30 * live.cycles_per_frame, movies=movies)
+    assert row['error'] is None
+    assert row['movie'] == movie_path
+    assert row['framebuffer_hash'] == hashlib.sha1(live.framebuffer_bytes()).hexdigest()
+
+
+def test_reset_clears_register_buffers_in_place():
+    '''
+    V, the keypad and memory are fixed bytearrays that reset clears in
+    place, and fork() copies the slot held state.
+    '''
+    cpu = chip8_hw.ChipEightCpu(seed=1)
+    V, key, memory, stack = cpu.V, cpu.key, cpu.memory, cpu.stack
+    assert isinstance(V, bytearray) and isinstance(key, bytearray)
+    cpu.load_rom_data(bytes([0x61, 0x05, 0x22, 0x00]))
+    cpu.run(max_cycles=3)
+    cpu.key[4] = 1
+    child = cpu.fork()
+    assert child.V == cpu.V and child.V is not cpu.V
+    assert child.stack == cpu.stack and child.pc == cpu.pc
+
+    class TracedCpu(chip8_hw.ChipEightCpu):
+        __slots__ = ('trace',)
+
+    traced = TracedCpu(seed=1)
+    traced.trace = [0x200]
+    traced_child = traced.fork()
+    assert traced_child.trace == [0x200] and traced_child.pc == traced.pc
+
+    cpu.reset()
+    assert cpu.V is V and cpu.key is key and cpu.stack is stack
+    assert cpu.V == bytes(16) and cpu.key == bytes(16) and cpu.stack == []
+    # Memory is still shared with the child, so it gets a fresh copy
+    assert cpu.memory is not memory
+    assert child.memory[0x200] == 0x61 and child.V[1] == 0x05
+    memory = cpu.memory
+    cpu.reset()
+    assert cpu.memory is memory
+    assert bytes(cpu.memory) == chip8_hw.POWER_ON_MEMORY
+
+
+def test_opcode_table_is_shared_between_machines():
+    '''
+    Machines decode through one class wide opcode table, a machine with an
+    edited instruction_dispatch keeps decoding through its own.
+    '''
+    first = _load_program(chip8_hw.ChipEightCpu(seed=1), bytes([0x61, 0x05, 0x81, 0x24]))
+    second = _load_program(chip8_hw.ChipEightCpu(seed=2), bytes([0x00, 0x00, 0x61, 0x05]))
+    first.run(max_cycles=2)
+    second.pc = 0x202
+    second.emulate_cycle()
+    assert second._decoded[0x202] is first._decoded[0x200]
+    assert first._decoded[0x202] is chip8_hw.ChipEightCpu.decode_opcode(0x8124)
+    assert first._decoded[0x202][0] is chip8_hw.ChipEightCpu.add_vx_vy
+    assert "instruction_dispatch" not in vars(first)
+
+    patched = _load_program(chip8_hw.ChipEightCpu(seed=3), bytes([0x61, 0x05]))
+    patched.ld_vx_byte = mock.MagicMock()
+    patched.instruction_dispatch[0x6000] = patched.ld_vx_byte
+    patched.emulate_cycle()
+    patched.ld_vx_byte.assert_called_once_with(0x6105)
+    assert chip8_hw.ChipEightCpu.decode_opcode(0x6105)[0] is chip8_hw.ChipEightCpu.ld_vx_byte
+
+    # Reading the table, as x8_dispatch does for an unknown 8xy8, is no edit
+    unknown = _load_program(chip8_hw.ChipEightCpu(seed=4), bytes([0x81, 0x28, 0x61, 0x05]))
+    unknown.emulate_cycle()
+    unknown.pc = 0x202
+    unknown.emulate_cycle()
+    assert "instruction_dispatch" in vars(unknown)
+    assert unknown._opcodes is chip8_hw.ChipEightCpu._opcode_table
+    assert unknown._decoded[0x202] is chip8_hw.ChipEightCpu.decode_opcode(0x6105)
+
+    # Subclasses resolve their own handlers, whatever their constructor takes
+    class NamedCpu(chip8_hw.ChipEightCpu):
+        def __init__(self, name):
+            chip8_hw.ChipEightCpu.__init__(self, seed=0)
+            self.name = name
+
+        def ld_vx_byte(self, opcode):
+            chip8_hw.ChipEightCpu.ld_vx_byte(self, opcode)
+            self.V[0xF] = 1
+
+    named = _load_program(NamedCpu('named'), bytes([0x61, 0x05]))
+    named.emulate_cycle()
+    assert named.V[1] == 0x05 and named.V[0xF] == 1
+    assert chip8_hw.ChipEightCpu.decode_opcode(0x6105)[0] is chip8_hw.ChipEightCpu.ld_vx_byte
+
+
+FUSION_TEST_PROGRAM = bytes([
+    0x60, 0x00,  # 200: LD V0, 0x00
+    0x61, 0x05,  # 202: LD V1, 0x05
+    0x62, 0x08,  # 204: LD V2, 0x08
+    0xA0, 0x00,  # 206: LD I, 0x000
+    0xD1, 0x25,  # 208: DRW V1, V2, 5
+    0x70, 0x01,  # 20A: ADD V0, 0x01
+    0x30, 0x0A,  # 20C: SE V0, 0x0A
+    0x12, 0x06,  # 20E: JP 0x206
+    0xE1, 0x9E,  # 210: SKP V1
+    0x12, 0x10,  # 212: JP 0x210
+    0x00, 0xE0,  # 214: CLS
+    0x12, 0x00,  # 216: JP 0x200
+])
+
+
+def test_fused_instructions_match_single_steps():
+    '''
+    run and run_frame fuse 6xkk runs, Annn+Dxyn and skip+jump, and end up
+    exactly where single stepping does, whatever the cycle budgets.
+    '''
+    stepped = _load_program(chip8_hw.ChipEightCpu(seed=1), FUSION_TEST_PROGRAM)
+    ran = _load_program(chip8_hw.ChipEightCpu(seed=1), FUSION_TEST_PROGRAM)
+    framed = _load_program(chip8_hw.ChipEightCpu(seed=1), FUSION_TEST_PROGRAM)
+    for chunk in range(40):
+        if chunk == 20:
+            for cpu in (stepped, ran, framed):
+                cpu.key[5] = 1
+        for _ in range(ran.cycles_per_frame):
+            stepped.emulate_cycle()
+        # Odd budgets split fused entries across calls
+        assert ran.run(max_cycles=5, until_key_wait=False).cycles == 5
+        assert ran.run(max_cycles=7, until_key_wait=False).cycles == 7
+        framed.run_frame()
+        assert ran.snapshot() == stepped.snapshot()
+        assert framed.snapshot() == stepped.snapshot()
+    # Only loop heads are looked up: the loads after JP 0x200, Annn+Dxyn
+    # after JP 0x206 and SKP+JP after JP 0x210. SE+JP at 0x20C is never
+    # branched back to.
+    assert sorted(ran._heads) == [0x200, 0x206, 0x210]
+    for address, count in ((0x200, 3), (0x206, 2), (0x210, 2)):
+        idle, fused = ran._heads[address]
+        assert idle == chip8_hw.NOT_IDLE and fused[1] == count
+
+    # Budgets of whole frames fuse in run() too
+    whole = _load_program(chip8_hw.ChipEightCpu(seed=1), FUSION_TEST_PROGRAM)
+    stepped = _load_program(chip8_hw.ChipEightCpu(seed=1), FUSION_TEST_PROGRAM)
+    assert whole.run(max_cycles=240, until_key_wait=False).cycles == 240
+    for _ in range(240):
+        stepped.emulate_cycle()
+    assert whole.snapshot() == stepped.snapshot()
+    # A fused entry runs the whole pattern and counts what it executed
+    load_run = ran._heads[0x200][1][0]
+    whole.pc = 0x200
+    assert load_run(whole) == 3 and whole.pc == 0x206
+    skip_jump = ran._heads[0x210][1][0]
+    whole.pc = 0x210
+    assert skip_jump(whole) == 2 and whole.pc == 0x210
+    whole.key[5] = 1
+    assert skip_jump(whole) == 1 and whole.pc == 0x214
+
+    cpu = _load_program(chip8_hw.ChipEightCpu(seed=1), FUSION_TEST_PROGRAM)
+    result = cpu.run(until_pc=0x208)
+    assert (result.cycles, result.stop_reason, cpu.I) == (4, chip8_hw.STOP_PC, 0x000)
+    assert cpu.V[2] == 0x08 and cpu.draw_count == 0
+
+    # Rewriting the jump drops the skip+jump fused over it
+    cpu.run(max_cycles=100, until_key_wait=False)
+    assert 0x210 in cpu._heads
+    cpu.memory[0x213] = 0x14
+    cpu.invalidate_decoded(0x213, 0x214)
+    assert 0x210 not in cpu._heads
+
+
+def test_gfx_view_writes_mark_rows_dirty():
+    cpu = chip8_hw.ChipEightCpu(seed=1)
+    cpu.dirty_rows = 0
+    generation = cpu.frame_generation
+    cpu.gfx[5 + 3 * 64] = 1
+    assert cpu.gfx_rows[3] == 1 << (63 - 5)
+    assert cpu.dirty_rows == 1 << 3
+    assert cpu.frame_generation == generation + 1
+    # Writing a pixel's current value changes nothing
+    cpu.dirty_rows = 0
+    cpu.gfx[5 + 3 * 64] = 1
+    assert cpu.dirty_rows == 0 and cpu.frame_generation == generation + 1
+    cpu.gfx[-1] = 1
+    assert cpu.dirty_rows == 1 << 31
+
+
+def test_gfx_view_slice_assignment_writes_rows():
+    cpu = chip8_hw.ChipEightCpu(seed=1)
+    cpu.dirty_rows = 0
+    generation = cpu.frame_generation
+    cpu.gfx[64:128] = [1] * 64
+    assert cpu.gfx_rows[1] == chip8_hw.ROW_MASK
+    assert cpu.dirty_rows == 1 << 1
+    assert cpu.frame_generation == generation + 1
+    # Extended slices, across rows, one generation per assignment
+    cpu.gfx[63:64 * 3:64] = [1, 0, 1]
+    assert cpu.gfx_rows[0] == 1 and cpu.gfx_rows[2] == 1
+    assert cpu.gfx_rows[1] == chip8_hw.ROW_MASK & ~1
+    assert cpu.dirty_rows == 0b111
+    assert cpu.frame_generation == generation + 2
+    assert cpu.gfx[64:128] == [1] * 63 + [0]
+    with pytest.raises(ValueError):
+        cpu.gfx[0:4] = [1, 1]
+
+
+def test_run_stops_on_key_wait_and_invalid_opcode_in_debug_mode():
+    cpu = _load_program(chip8_hw.ChipEightCpu(seed=1), bytes([0x61, 0x02, 0xF1, 0x0A]))
+    cpu.debug = True
+    assert cpu.run(max_cycles=1000) == chip8_hw.RunResult(2, chip8_hw.STOP_KEY_WAIT, 0)
+    assert cpu.pc == 0x202
+
+    cpu = _load_program(chip8_hw.ChipEightCpu(seed=1), bytes([0x61, 0x02, 0xF1, 0xFF]))
+    cpu.debug = True
+    with mock.patch('builtins.print'):
+        result = cpu.run()
+    assert result == chip8_hw.RunResult(2, chip8_hw.STOP_INVALID_OPCODE, 0)
+
+
+def test_frame_exchange_does_not_reuse_rows_across_loaded_cpus():
+    old = chip8_hw.ChipEightCpu(seed=1)
+    old.gfx_rows[0] = 1
+    emulator = chip8emu.EmulationThread(old)
+    emulator.run_frames(0)
+    assert emulator.frames.take().gfx_rows[0] == 1
+
+    new = chip8_hw.ChipEightCpu(seed=1)
+    new.frame_generation = old.frame_generation
+    emulator._load(new, None)
+    emulator.run_frames(0)
+    assert emulator.frames.take().gfx_rows == new.gfx_rows
+
+
 
 
 # def test_0x00E0():
@@ -1,3 +1,5 @@
+import queue
+import threading
 import time
 import tkinter as tk
 from tkinter import filedialog
@@ -7,10 +9,21 @@ import sdl2.ext
 import ctypes
 import math
 import array
+import struct
 
 import chip8_hw
+import chip8_movie
+import chip8_rewind
 
 CYCLE_HZ = 700.0
+FRAME_HZ = 60.0
+# Instructions per 60 Hz frame handed to the CPU
+CYCLES_PER_FRAME = round(CYCLE_HZ / FRAME_HZ)
+# Most frames run back to back to catch up after a stall, older ones are
+# dropped instead of spiralling further behind.
+MAX_CATCHUP_FRAMES = 4
+# Most times per second the debug window is refreshed
+DEBUG_HZ = 30.0
 
 # Mapping of host keyboard keys to CHIP-8 keypad indices.
 # This follows the common layout:
@@ -84,6 +97,292 @@ CHIP8_HEIGHT = 32
 WINDOW_WIDTH = 640
 WINDOW_HEIGHT = 480
 
+PIXEL_ON = 0xFFFFFFFF
+PIXEL_OFF = 0xFF000000
+# Bytes per row of the RGBA8888 texture
+ROW_BYTES = CHIP8_WIDTH * 4
+# RGBA bytes of the 8 pixels packed into each possible display byte
+PIXEL_LUT = [
+    b"".join(
+        struct.pack("=I", PIXEL_ON if (value >> (7 - bit)) & 1 else PIXEL_OFF)
+        for bit in range(8)
+    )
+    for value in range(256)
+]
+
+
+class FrameScheduler:
+    """Turn wall clock time into whole 60 Hz frames to emulate.
+
+    ``frames_due`` returns how many frames should run now. After a stall
+    at most ``max_catchup`` frames are returned and the rest of the
+    backlog is dropped.
+    """
+
+    def __init__(self, frame_hz=FRAME_HZ, max_catchup=MAX_CATCHUP_FRAMES, now=0.0):
+        self.frame_time = 1.0 / frame_hz
+        self.max_catchup = max_catchup
+        self.reset(now)
+
+    def reset(self, now):
+        self.next_frame = now
+
+    def frames_due(self, now):
+        if now < self.next_frame:
+            return 0
+        frames = int((now - self.next_frame) / self.frame_time) + 1
+        if frames > self.max_catchup:
+            frames = self.max_catchup
+            self.next_frame = now + self.frame_time
+        else:
+            self.next_frame += frames * self.frame_time
+        return frames
+
+
+class DisplayFrame:
+    """A copy of the CPU display handed from the emulation thread to the UI.
+
+    Has the same ``gfx_rows``/``dirty_rows``/``frame_generation`` attributes
+    as ``ChipEightCpu`` so it can be passed straight to ``draw_screen``.
+    """
+
+    def __init__(self, gfx_rows, dirty_rows, frame_generation, sound_timer):
+        self.gfx_rows = gfx_rows
+        self.dirty_rows = dirty_rows
+        self.frame_generation = frame_generation
+        self.sound_timer = sound_timer
+
+
+class FrameExchange:
+    """Double buffer of ``DisplayFrame`` between the emulation and UI threads.
+
+    The emulation thread builds the next frame outside the lock and swaps it
+    in with ``publish``; the UI thread takes the newest one with ``take``.
+    Frames the UI never took are dropped, but their dirty rows carry over.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._front = None
+        self._last = None
+        # CPU _last was published from, generations are only comparable
+        # within one CPU
+        self._last_cpu = None
+
+    def publish(self, cpu):
+        dirty = cpu.dirty_rows
+        cpu.dirty_rows = 0
+        last = self._last
+        if last is not None and self._last_cpu is cpu and \
+                last.frame_generation == cpu.frame_generation:
+            # Display unchanged, share the row copy instead of making one
+            rows = last.gfx_rows
+        else:
+            rows = list(cpu.gfx_rows)
+        frame = DisplayFrame(rows, dirty, cpu.frame_generation, cpu.sound_timer)
+        with self._lock:
+            if self._front is not None:
+                frame.dirty_rows |= self._front.dirty_rows
+            self._front = frame
+        self._last = frame
+        self._last_cpu = cpu
+
+    def take(self):
+        """Return the newest frame not taken yet, or ``None``."""
+        with self._lock:
+            frame = self._front
+            self._front = None
+        return frame
+
+
+class EmulationThread(threading.Thread):
+    """Runs a ``ChipEightCpu`` in 60 Hz frames on its own thread.
+
+    The thread owns the CPU. The UI talks to it only through the methods
+    below, which queue events applied on the emulation thread between
+    frames, and reads the display from ``frames``.
+
+    A ``chip8_movie.MovieRecorder`` passed to ``load`` records every key
+    change with the frame it lands on. Stepping or rewinding can't be
+    replayed, so either one ends the recording.
+    """
+
+    def __init__(
+        self,
+        cpu,
+        frame_hz=FRAME_HZ,
+        max_catchup=MAX_CATCHUP_FRAMES,
+        clock=time.perf_counter,
+    ):
+        super().__init__(name="chip8-emulation", daemon=True)
+        self.cpu = cpu
+        self.frames = FrameExchange()
+        self.rom_loaded = False
+        self.paused = False
+        self.rewinding = False
+        # Total instructions run, read by the UI for its CPS display
+        self.cycles_executed = 0
+        self.rewind = chip8_rewind.RewindBuffer(seconds=10)
+        self.recorder = None
+        # Frames run since the ROM was loaded, the movie timeline
+        self.frame = 0
+        self._clock = clock
+        self._scheduler = FrameScheduler(frame_hz, max_catchup, clock())
+        self._events = queue.SimpleQueue()
+        self._running = True
+
+    # Called from the UI thread
+    def load(self, cpu, recorder=None):
+        self._events.put((self._load, (cpu, recorder)))
+
+    def key_event(self, key_sym, pressed):
+        self._events.put((self._key_event, (key_sym, pressed)))
+
+    def toggle_pause(self):
+        self._events.put((self._toggle_pause, ()))
+
+    def step(self):
+        self._events.put((self._step, ()))
+
+    def set_rewinding(self, rewinding):
+        self._events.put((self._set_rewinding, (rewinding,)))
+
+    def stop(self):
+        self._events.put((self._quit, ()))
+
+    # Run on the emulation thread
+    def _load(self, cpu, recorder):
+        self._end_recording()
+        self.cpu = cpu
+        self.recorder = recorder
+        self.frame = 0
+        self.rom_loaded = True
+        self.rewind.clear()
+        self._scheduler.reset(self._clock())
+
+    def _key_event(self, key_sym, pressed):
+        process_key_event(self.cpu, key_sym, pressed)
+        if self.recorder is not None:
+            self.recorder.record(self.frame, self.cpu.key)
+
+    def _toggle_pause(self):
+        self.paused = not self.paused
+
+    def _step(self):
+        if self.rom_loaded and self.paused:
+            self._end_recording()
+            self.cpu.emulate_cycle()
+            self.cycles_executed += 1
+            self.frames.publish(self.cpu)
+
+    def _set_rewinding(self, rewinding):
+        if rewinding:
+            self._end_recording()
+        self.rewinding = rewinding
+
+    def _quit(self):
+        self._end_recording()
+        self._running = False
+
+    def _end_recording(self):
+        if self.recorder is not None:
+            self.recorder.close(self.frame)
+            self.recorder = None
+
+    def process_events(self, timeout=None):
+        """Apply queued UI events, waiting up to ``timeout`` for the first."""
+        try:
+            handler, args = self._events.get(timeout=timeout)
+            while True:
+                handler(*args)
+                handler, args = self._events.get_nowait()
+        except queue.Empty:
+            pass
+
+    def run_frames(self, frames):
+        """Emulate ``frames`` 60 Hz frames and publish the display."""
+        cpu = self.cpu
+        if self.rom_loaded and not self.paused:
+            if self.rewinding:
+                for _ in range(frames):
+                    # Keys are live input, don't bring back recorded ones
+                    keys = cpu.key[:]
+                    self.rewind.rewind(cpu)
+                    cpu.key[:] = keys
+            else:
+                for _ in range(frames):
+                    self.cycles_executed += cpu.run_frame()
+                    self.rewind.push(cpu)
+                self.frame += frames
+        self.frames.publish(cpu)
+
+    def run(self):
+        scheduler = self._scheduler
+        while self._running:
+            frames = scheduler.frames_due(self._clock())
+            if frames:
+                self.run_frames(frames)
+                self.process_events(timeout=0)
+            else:
+                # Sleep until the next frame is due, waking early for input
+                self.process_events(
+                    timeout=max(scheduler.next_frame - self._clock(), 0)
+                )
+
+
+def debug_texts(cpu, perf):
+    """Return the text of every debug window label, keyed by label name."""
+    texts = {}
+    if cpu is not None:
+        texts["PC"] = f"PC: {cpu.pc:03X}"
+        texts["I"] = f"I: {cpu.I:03X}"
+        texts["DT"] = f"DT: {cpu.delay_timer:02X}"
+        texts["ST"] = f"ST: {cpu.sound_timer:02X}"
+        texts["BEEPS"] = f"BEEPS: {cpu.beep_count}"
+        for i in range(16):
+            texts[f"V{i}"] = f"{cpu.V[i]:02X}"
+    texts["CPS"] = f"CPS: {perf['cps']:.0f}"
+    texts["FPS"] = f"FPS: {perf['fps']:.0f}"
+    return texts
+
+
+def rom_hex_dump(rom, start=0x200):
+    """Format ``rom`` as 16 byte hex lines addressed from ``start``."""
+    return "".join(
+        f"{start + offset:03X}: {rom[offset : offset + 16].hex(' ').upper()}\n"
+        for offset in range(0, len(rom), 16)
+    )
+
+
+class DebugObserver:
+    """Sample CPU state for the debug window at a fixed rate.
+
+    ``sample`` does nothing until ``1 / rate_hz`` seconds have passed since
+    the last sample, and then only calls ``set_text(name, text)`` for the
+    labels whose text changed.
+    """
+
+    def __init__(self, set_text, rate_hz=DEBUG_HZ, clock=time.perf_counter):
+        self.set_text = set_text
+        self.interval = 1.0 / rate_hz
+        self.clock = clock
+        self._shown = {}
+        self._next_sample = None
+
+    def sample(self, cpu, perf, force=False):
+        """Refresh changed labels, returns how many were updated."""
+        now = self.clock()
+        if not force and self._next_sample is not None and now < self._next_sample:
+            return 0
+        self._next_sample = now + self.interval
+        updated = 0
+        for name, text in debug_texts(cpu, perf).items():
+            if self._shown.get(name) != text:
+                self._shown[name] = text
+                self.set_text(name, text)
+                updated += 1
+        return updated
+
 
 def select_rom():
     """Open a file dialog and return the selected ROM path."""
@@ -139,32 +438,34 @@ def create_menu(root, chip8_ref):
     debug_win.withdraw()
 
     perf = {"cps": 0, "fps": 0}
+    observer = DebugObserver(lambda name, text: labels[name].config(text=text))
+    # ROM of the loaded CPU and the one currently in the hex view. The view
+    # is only filled in while the debug window is open.
+    rom = None
+    rom_shown = None
+
+    def fill_rom_view():
+        nonlocal rom_shown
+        if rom is not rom_shown:
+            rom_text.delete("1.0", tk.END)
+            rom_text.insert("1.0", rom_hex_dump(rom))
+            rom_shown = rom
 
     def update_rom_view(cpu):
-        rom_text.delete("1.0", tk.END)
-        for offset in range(0, len(cpu.rom), 16):
-            addr = 0x200 + offset
-            chunk = cpu.rom[offset : offset + 16]
-            chunk_hex = " ".join(f"{b:02X}" for b in chunk)
-            rom_text.insert(tk.END, f"{addr:03X}: {chunk_hex}\n")
-
-    def update_debug(cpu=None):
-        if cpu is not None:
-            labels["PC"].config(text=f"PC: {cpu.pc:03X}")
-            labels["I"].config(text=f"I: {cpu.I:03X}")
-            labels["DT"].config(text=f"DT: {cpu.delay_timer:02X}")
-            labels["ST"].config(text=f"ST: {cpu.sound_timer:02X}")
-            labels["BEEPS"].config(text=f"BEEPS: {cpu.beep_count}")
-            for i in range(16):
-                labels[f"V{i}"].config(text=f"{cpu.V[i]:02X}")
-
-
-        labels["CPS"].config(text=f"CPS: {perf['cps']:.0f}")
-        labels["FPS"].config(text=f"FPS: {perf['fps']:.0f}")
+        nonlocal rom
+        rom = cpu.rom
+        if debug_var.get():
+            fill_rom_view()
+
+    def update_debug(cpu=None, force=False):
+        observer.sample(cpu, perf, force)
 
     def toggle_debug():
         chip8_ref[0].debug = debug_var.get()
         if chip8_ref[0].debug:
+            if rom is not None:
+                fill_rom_view()
+            update_debug(chip8_ref[0], force=True)
             debug_win.deiconify()
         else:
             debug_win.withdraw()
@@ -178,6 +479,7 @@ def create_menu(root, chip8_ref):
     menu_bar = tk.Menu(root)
     file_menu = tk.Menu(menu_bar, tearoff=0)
     file_menu.add_command(label="Load")
+    file_menu.add_command(label="Load and Record Input...")
     file_menu.add_separator()
     file_menu.add_command(label="Exit")
     menu_bar.add_cascade(label="File", menu=file_menu)
@@ -187,11 +489,31 @@ def create_menu(root, chip8_ref):
     menu_bar.add_cascade(label="Settings", menu=settings)
     root.config(menu=menu_bar)
 
-    chip8_ref[0].debug_callback = update_debug
 
     return debug_win, update_debug, update_rom_view, toggle_debug, file_menu, perf
 
 
+def update_framebuffer(chip8, framebuffer):
+    """Expand the CPU's dirty display rows into the RGBA ``framebuffer``.
+
+    Returns ``(first_row, row_count)`` covering the rows that changed, or
+    ``None`` if nothing did. The CPU's dirty rows are cleared.
+    """
+    dirty = chip8.dirty_rows
+    if not dirty:
+        return None
+    chip8.dirty_rows = 0
+    first = (dirty & -dirty).bit_length() - 1
+    last = dirty.bit_length() - 1
+    rows = chip8.gfx_rows
+    for y in range(first, last + 1):
+        if (dirty >> y) & 1:
+            framebuffer[y * ROW_BYTES : (y + 1) * ROW_BYTES] = b"".join(
+                [PIXEL_LUT[b] for b in rows[y].to_bytes(CHIP8_WIDTH // 8, "big")]
+            )
+    return first, last - first + 1
+
+
 def draw_screen(renderer, chip8, window, texture, framebuffer):
     win_w = ctypes.c_int()
     win_h = ctypes.c_int()
@@ -211,10 +533,16 @@ def draw_screen(renderer, chip8, window, texture, framebuffer):
     scale_x = draw_w / CHIP8_WIDTH
     scale_y = draw_h / CHIP8_HEIGHT
 
-    for i, pixel in enumerate(chip8.gfx):
-        framebuffer[i] = 0xFFFFFFFF if pixel else 0xFF000000
-
-    sdl2.SDL_UpdateTexture(texture, None, framebuffer, CHIP8_WIDTH * 4)
+    span = update_framebuffer(chip8, framebuffer)
+    if span is not None:
+        # Upload only the changed rows, straight out of the bytearray
+        first, count = span
+        pixels = (ctypes.c_char * len(framebuffer)).from_buffer(framebuffer)
+        rect = sdl2.SDL_Rect(0, first, CHIP8_WIDTH, count)
+        sdl2.SDL_UpdateTexture(
+            texture, rect, ctypes.byref(pixels, first * ROW_BYTES), ROW_BYTES
+        )
+        del pixels
 
     dest = sdl2.SDL_Rect(off_x, off_y, draw_w, draw_h)
     sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 255)
@@ -245,7 +573,7 @@ def main():
         CHIP8_WIDTH,
         CHIP8_HEIGHT,
     )
-    framebuffer = (ctypes.c_uint32 * (CHIP8_WIDTH * CHIP8_HEIGHT))()
+    framebuffer = bytearray(ROW_BYTES * CHIP8_HEIGHT)
 
     # --------------------
     # Audio setup
@@ -274,10 +602,10 @@ def main():
     audio_device = sdl2.SDL_OpenAudioDevice(None, 0, desired, None, 0)
     sound_playing = False
 
-    def handle_sound():
+    def handle_sound(sound_timer):
         """Play or stop the tone based on the CHIP-8 sound timer."""
         nonlocal sound_playing
-        if chip8_ref[0].sound_timer > 0:
+        if sound_timer > 0:
             sdl2.SDL_QueueAudio(audio_device, beep_bytes, len(beep_bytes))
             if not sound_playing:
                 sdl2.SDL_PauseAudioDevice(audio_device, 0)
@@ -287,77 +615,91 @@ def main():
             sdl2.SDL_PauseAudioDevice(audio_device, 1)
             sound_playing = False
 
-    chip8_ref = [chip8_hw.ChipEightCpu()]
-    rom_loaded = False
+    chip8_ref = [chip8_hw.ChipEightCpu(cycles_per_frame=CYCLES_PER_FRAME)]
+    # The CPU is stepped on its own thread so Tk stalls don't slow it down,
+    # this thread only handles input, sound and presenting frames.
+    emulator = EmulationThread(chip8_ref[0])
 
     def on_frame_resize(event):
+        nonlocal presented_generation
         sdl2.SDL_SetWindowSize(window, event.width, event.height)
+        presented_generation = None
 
     frame.bind("<Configure>", on_frame_resize)
 
     def on_key_press(event):
-        nonlocal paused, step_once
         key = event.keysym.lower()
         if key == "p":
-            paused = not paused
+            emulator.toggle_pause()
         elif key == "i":
-            step_once = True
+            emulator.step()
+        elif key == "backspace":
+            emulator.set_rewinding(True)
         else:
-            process_key_event(chip8_ref[0], event.keysym, True)
+            emulator.key_event(event.keysym, True)
 
     def on_key_release(event):
         key = event.keysym.lower()
-        if key not in {"p", "i"}:
-            process_key_event(chip8_ref[0], event.keysym, False)
+        if key == "backspace":
+            emulator.set_rewinding(False)
+        elif key not in {"p", "i"}:
+            emulator.key_event(event.keysym, False)
 
     root.bind_all("<KeyPress>", on_key_press)
     root.bind_all("<KeyRelease>", on_key_release)
     frame.focus_set()
 
-    debug_win, update_debug, update_rom_view, toggle_debug, file_menu, perf = create_menu(root, chip8_ref)
+    (debug_win, update_debug, update_rom_view, toggle_debug, file_menu,
+     perf) = create_menu(root, chip8_ref)
 
     running = True
-    paused = False
-    step_once = False
-    frame_delay = 1 / 60.0
-    cycle_hz = CYCLE_HZ
+    # frame_generation of the CPU display last presented, None forces the
+    # next frame to be presented
+    presented_generation = None
 
     last_time = time.time()
-    cycle_accum = 0.0
-    last_frame = last_time
-    cycles_executed = 0
+    last_cycles = 0
     last_cps_update = last_time
     fps_count = 0
     last_fps_update = last_time
 
-    def load_rom():
-        nonlocal rom_loaded, last_time, last_frame, cycle_accum, cycles_executed, last_cps_update, fps_count, last_fps_update
+    def load_rom(record=False):
+        nonlocal presented_generation, last_cycles, last_cps_update, fps_count, \
+            last_fps_update
         path = select_rom()
         if path:
-            chip8_ref[0] = chip8_hw.ChipEightCpu(debug_callback=update_debug)
-            chip8_ref[0].load_rom(path)
+            cpu = chip8_hw.ChipEightCpu(cycles_per_frame=CYCLES_PER_FRAME)
+            cpu.load_rom(path)
+            recorder = None
+            if record:
+                movie_path = filedialog.asksaveasfilename(
+                    title="Record input movie",
+                    defaultextension=chip8_movie.MOVIE_EXTENSION)
+                if not movie_path:
+                    return
+                recorder = chip8_movie.MovieRecorder(open(movie_path, 'wb'), cpu)
+            chip8_ref[0] = cpu
+            emulator.load(cpu, recorder)
             # Ensure the CPU debug flag matches the UI state so the memory view
             # updates immediately after loading a ROM.
             toggle_debug()
-            update_rom_view(chip8_ref[0])
-            update_debug(chip8_ref[0])
-            rom_loaded = True
-            chip8_ref[0].update_screen = True
-            last_time = time.time()
-            cycle_accum = 0.0
-            last_frame = last_time
-            cycles_executed = 0
-            last_cps_update = last_time
+            update_rom_view(cpu)
+            update_debug(cpu, force=True)
+            presented_generation = None
+            now = time.time()
+            last_cycles = emulator.cycles_executed
+            last_cps_update = now
             fps_count = 0
-            last_fps_update = last_time
+            last_fps_update = now
 
     file_menu.entryconfig(0, command=load_rom)
+    file_menu.entryconfig(1, command=lambda: load_rom(record=True))
 
     def exit_app():
         nonlocal running
         running = False
 
-    file_menu.entryconfig(2, command=exit_app)
+    file_menu.entryconfig(3, command=exit_app)
 
 
     def on_close():
@@ -366,55 +708,51 @@ def main():
 
     root.protocol("WM_DELETE_WINDOW", on_close)
 
+    emulator.start()
+
     while running:
         for event in sdl2.ext.get_events():
             if event.type == sdl2.SDL_QUIT:
                 running = False
             elif event.type == sdl2.SDL_KEYDOWN:
                 if event.key.keysym.sym == sdl2.SDLK_p:
-                    paused = not paused
+                    emulator.toggle_pause()
                 elif event.key.keysym.sym == sdl2.SDLK_i:
-                    step_once = True
+                    emulator.step()
+                elif event.key.keysym.sym == sdl2.SDLK_BACKSPACE:
+                    emulator.set_rewinding(True)
                 else:
-                    process_key_event(chip8_ref[0], event.key.keysym.sym, True)
+                    emulator.key_event(event.key.keysym.sym, True)
             elif event.type == sdl2.SDL_KEYUP:
-                if event.key.keysym.sym not in (sdl2.SDLK_p, sdl2.SDLK_i):
-                    process_key_event(chip8_ref[0], event.key.keysym.sym, False)
+                if event.key.keysym.sym == sdl2.SDLK_BACKSPACE:
+                    emulator.set_rewinding(False)
+                elif event.key.keysym.sym not in (sdl2.SDLK_p, sdl2.SDLK_i):
+                    emulator.key_event(event.key.keysym.sym, False)
 
         now = time.time()
-        dt = now - last_time
-        last_time = now
-
-        if rom_loaded:
-            if paused:
-                if step_once:
-                    chip8_ref[0].emulate_cycle()
-                    handle_sound()
-                    step_once = False
-                    cycles_executed += 1
-            else:
-                cycle_accum += dt * cycle_hz
-                while cycle_accum >= 1.0:
-                    chip8_ref[0].emulate_cycle()
-                    handle_sound()
-                    cycle_accum -= 1.0
-                    cycles_executed += 1
-
-            if now - last_cps_update >= 1.0:
-                perf["cps"] = cycles_executed / (now - last_cps_update)
-                cycles_executed = 0
-                last_cps_update = now
-
-            if now - last_frame >= frame_delay or chip8_ref[0].update_screen:
-                draw_screen(renderer, chip8_ref[0], window, texture, framebuffer)
-                chip8_ref[0].update_screen = False
-                last_frame = now
+        # The emulation thread publishes once per batch of 60 Hz frames,
+        # audio and video are updated once per published frame.
+        display = emulator.frames.take()
+
+        if display is not None:
+            handle_sound(display.sound_timer)
+            # Present only when the display changed, a vsynced present
+            # blocks this thread rather than the emulation.
+            if display.frame_generation != presented_generation:
+                draw_screen(renderer, display, window, texture, framebuffer)
+                presented_generation = display.frame_generation
                 fps_count += 1
 
-            if now - last_fps_update >= 1.0:
-                perf["fps"] = fps_count / (now - last_fps_update)
-                fps_count = 0
-                last_fps_update = now
+        if now - last_cps_update >= 1.0:
+            cycles = emulator.cycles_executed
+            perf["cps"] = (cycles - last_cycles) / (now - last_cps_update)
+            last_cycles = cycles
+            last_cps_update = now
+
+        if now - last_fps_update >= 1.0:
+            perf["fps"] = fps_count / (now - last_fps_update)
+            fps_count = 0
+            last_fps_update = now
 
 
         if chip8_ref[0].debug:
@@ -422,9 +760,10 @@ def main():
 
         root.update_idletasks()
         root.update()
-        handle_sound()
         sdl2.SDL_Delay(1)
 
+    emulator.stop()
+    emulator.join(timeout=1.0)
     root.destroy()
     sdl2.SDL_DestroyRenderer(renderer)
     sdl2.SDL_CloseAudioDevice(audio_device)